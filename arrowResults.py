@@ -0,0 +1,186 @@
+import io
+import json
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from queryCost import is_select
+
+
+def column_array(values):
+    """
+    Arrow array of one column's python values.
+
+    Columns mixing types, which sqlite and schemaless documents allow, become
+    strings with objects and lists as JSON.
+    """
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([
+            None if value is None else json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+            for value in values
+        ], pa.string())
+
+
+def rows_table(names, rows):
+    """Table from row tuples, built one column at a time"""
+    # A comprehension per column, zip(*rows) is several times slower on large results
+    return pa.table([column_array([row[i] for row in rows]) for i in range(len(names))], names=names)
+
+
+def es_hits_table(hits):
+    """
+    Table of the _source of Elasticsearch hits.
+
+    Arrow decodes the documents as one struct array, the union of their
+    fields in the order they first appear. Documents mixing types in a
+    field are decoded column by column instead.
+    """
+    sources = [hit.get("_source", {}) for hit in hits]
+    if not sources:
+        return pa.table({})
+    try:
+        return pa.Table.from_struct_array(pa.array(sources))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        names = list(dict.fromkeys(name for source in sources for name in source))
+        return pa.table([column_array([source.get(name) for source in sources]) for name in names], names=names)
+
+
+def concat_batches(tables):
+    """
+    Batches of one result as a single table.
+
+    A column whose type differs between batches, say integers in one and
+    text in the next, is converted again as one column.
+    """
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        names = tables[0].column_names
+        columns = [
+            column_array([value for table in tables for value in table.column(i).to_pylist()])
+            for i in range(len(names))
+        ]
+        return pa.table(columns, names=names)
+
+
+# Rows fetched from sqlite at a time, only one batch of python tuples is alive at once
+BATCH_ROWS = 50000
+
+
+def read_sqlite_arrow(query, conn):
+    """Run query on a sqlite3 connection into a table, without a DataFrame in between"""
+    cursor = conn.execute(query)
+    try:
+        names = [column[0] for column in cursor.description or ()]
+        batches = []
+        while True:
+            rows = cursor.fetchmany(BATCH_ROWS)
+            if not rows:
+                break
+            batches.append(rows_table(names, rows))
+    finally:
+        cursor.close()
+    return concat_batches(batches) if batches else rows_table(names, [])
+
+
+# Arrow types of common postgres type oids, the others are read as strings
+POSTGRES_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(), 21: pa.int16(), 23: pa.int32(), 26: pa.int64(),
+    700: pa.float32(), 701: pa.float64(),
+    1082: pa.date32(), 1114: pa.timestamp("us"), 1184: pa.timestamp("us", tz="UTC"),
+}
+
+
+# numeric is read as text and then turned into a decimal, a float would round it
+NUMERIC = 1700
+
+
+def _numeric_type(precision, scale):
+    if precision is None or precision > 76:
+        return None
+    precision = max(precision, 1)
+    return pa.decimal128(precision, scale) if precision <= 38 else pa.decimal256(precision, scale)
+
+
+def _numeric_column(values, precision=None, scale=None):
+    """
+    Decimal array of a numeric column read as text.
+
+    Unconstrained numeric has no precision and scale in the description,
+    they are taken from the longest values. A column holding NaN or
+    Infinity, which no decimal can, stays text.
+    """
+    if pc.any(pc.match_substring_regex(values, "[^0-9.-]")).as_py():
+        return values
+    if precision is None or scale is None:
+        point = pc.find_substring(values, ".")
+        length = pc.utf8_length(values)
+        has_point = pc.greater_equal(point, 0)
+        scale = pc.max(pc.if_else(has_point, pc.subtract(pc.subtract(length, point), 1), 0)).as_py() or 0
+        whole = pc.subtract(pc.if_else(has_point, point, length), pc.cast(pc.starts_with(values, "-"), pa.int32()))
+        precision = (pc.max(whole).as_py() or 0) + scale
+    decimal = _numeric_type(precision, scale)
+    return values if decimal is None else pc.cast(values, decimal)
+
+
+def _dbapi_connection(conn):
+    # A SQLAlchemy connection hands out the psycopg2 connection it wraps
+    return getattr(conn, "connection", conn)
+
+
+def read_postgres_arrow(query, conn):
+    """
+    Run a SELECT through COPY ... TO STDOUT and parse the CSV into a table with pyarrow.
+
+    Column types come from the query's description, so text like zip codes
+    is not read as numbers, numeric becomes a decimal. Other statements go
+    through pandas.
+    """
+    if not is_select(query):
+        return pa.Table.from_pandas(pd.read_sql_query(query, conn), preserve_index=False)
+    source = query.rstrip().rstrip(";")
+    cursor = _dbapi_connection(conn).cursor()
+    try:
+        cursor.execute(f"SELECT * FROM (\n{source}\n) AS described LIMIT 0")
+        description = cursor.description
+        names = [column.name for column in description]
+        types = [POSTGRES_TYPES.get(column.type_code, pa.string()) for column in description]
+        buffer = io.BytesIO()
+        cursor.copy_expert(f"COPY (\n{source}\n) TO STDOUT WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    if not buffer.getbuffer().nbytes:
+        columns = [pa.array([], column_type) for column_type in types]
+        for i, column in enumerate(description):
+            if column.type_code == NUMERIC:
+                columns[i] = _numeric_column(columns[i], getattr(column, "precision", None), getattr(column, "scale", None))
+        return pa.table(columns, names=names)
+    buffer.seek(0)
+    # Unique column names for the parser, duplicate result names are put back afterwards
+    column_names = [f"c{i}" for i in range(len(names))]
+    table = pa_csv.read_csv(
+        buffer,
+        read_options=pa_csv.ReadOptions(column_names=column_names),
+        # A NULL in a one column result is an empty line
+        parse_options=pa_csv.ParseOptions(ignore_empty_lines=False),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=dict(zip(column_names, types)),
+            # COPY writes NULL unquoted and empty strings quoted. Only the empty field is NULL,
+            # pyarrow's default null values would also read float NaN and text like "NULL" or "N/A" as NULL.
+            null_values=[""],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+            true_values=["t"],
+            false_values=["f"],
+        ),
+    )
+    for i, column in enumerate(description):
+        if column.type_code == NUMERIC:
+            values = _numeric_column(
+                table.column(i).combine_chunks(), getattr(column, "precision", None), getattr(column, "scale", None)
+            )
+            table = table.set_column(i, column_names[i], values)
+    return table.rename_columns(names)
@@ -0,0 +1,258 @@
+"""
+Flatten synthetic deep aggregation responses with the old recursive flattener and flatten_aggs.
+
+Each case builds a response shaped like Elasticsearch's with about --leaves
+leaf buckets and times flattening plus building the table st.dataframe gets.
+Run from the repository root:
+    python -m benchmarks.benchmarkAggs 100000
+"""
+import sys
+import time
+import pandas as pd
+import pyarrow as pa
+from arrowResults import column_array
+from createTable import flatten_aggs
+
+
+# The recursive flattener flatten_aggs replaced, kept as the baseline
+
+def legacy_process_nested_aggs(agg_data, current_path=None, current_row=None):
+    """
+    Recursively process nested aggregations and create rows for each combination.
+    
+    Args:
+        agg_data: The current aggregation data to process
+        current_path: List tracking the current path in the aggregation hierarchy
+        current_row: Dictionary representing the current row being built
+        
+    Returns:
+        List of dictionaries, each representing a complete row
+    """
+    if current_path is None:
+        current_path = []
+    if current_row is None:
+        current_row = {}
+            
+    result_rows = []
+    
+    # Get the current aggregation name
+    if current_path:
+        # agg_name = current_path[-1]
+        agg_name = ".".join(current_path[1:])     
+        just_name = current_path[-1] 
+        current_row_name = agg_name if agg_name else just_name   
+    else:
+        # Fallback name if path is empty (shouldn't happen in practice)
+        agg_name = ""
+    
+    
+    # Handle bucket aggregations
+    if "buckets" in agg_data:
+        buckets = agg_data["buckets"]
+        
+        if isinstance(buckets, list):
+            
+            # Process each bucket
+            for bucket in buckets:
+                # Create a new row with the current bucket's data
+                new_row = current_row.copy()
+                new_row[current_row_name] = bucket.get("key_as_string", "") if "key_as_string" in bucket else bucket.get("key", "")
+                new_row[f"{current_row_name}_count"] = bucket.get("doc_count", 0)
+                
+                # Collect all metric aggregations at this level
+                metric_values = {}
+                sub_agg_keys = []
+                
+                for sub_key, sub_value in bucket.items():
+                    if sub_key not in ["key", "doc_count", "key_as_string"]:
+                        if "value" in sub_value:
+                            # This is a metric aggregation - add to current row
+                            row_key = agg_name + "." + sub_key if agg_name else sub_key
+                            metric_values[row_key] = sub_value["value"]
+                        elif "values" in sub_value:
+                            # Handle percentiles
+                            name=f"{sub_key}_{percentile}"
+                            row_key = agg_name + "." + name if agg_name else name
+                            for percentile, value in sub_value["values"].items():
+                                metric_values[row_key] = value
+                        elif "buckets" in sub_value:
+                            # This is a sub-bucket aggregation - process recursively later
+                            sub_agg_keys.append(sub_key)
+                
+                # Add all metrics to the row
+                new_row.update(metric_values)
+                #TODO product decision. To merge the rows, 
+                # you have to collect the sub_rows then call process_nested_aggs on each of the sub_rows
+                # this will multiply the rows with every agg at the same lebel
+                # only at the final subrow do you call result_rows.extend(sub_rows)
+                if sub_agg_keys:
+                    newCurrentPath=[]
+                    if len(current_path)>1 or len(sub_agg_keys)>1:
+                        newCurrentPath = current_path
+             
+                    # Process sub-bucket aggregations
+                    for sub_key in sub_agg_keys:
+                        sub_value = bucket[sub_key]
+                        sub_rows = legacy_process_nested_aggs(
+                            sub_value,
+                            newCurrentPath + [sub_key],
+                            new_row.copy()  # Pass the row with metrics already added
+                        )
+                        result_rows.extend(sub_rows)
+                else:
+                    # No sub-buckets, just add this row
+                    result_rows.append(new_row)
+        
+        elif isinstance(buckets, dict):
+            # Handle composite or filters aggregation
+            for key, bucket in buckets.items():
+                new_row = current_row.copy()
+                new_row[current_row_name] = key
+                new_row[f"{current_row_name}_count"] = bucket.get("doc_count", 0)
+                
+                # Collect all metric aggregations at this level
+                metric_values = {}
+                sub_agg_keys = []
+                
+                for sub_key, sub_value in bucket.items():
+                    if sub_key not in ["doc_count"]:
+                        if "value" in sub_value:
+                            # This is a metric aggregation
+                            metric_values[agg_name + "." + sub_key] = sub_value["value"]
+                        elif "values" in sub_value:
+                            # Handle percentiles
+                            for percentile, value in sub_value["values"].items():
+                                metric_values[agg_name + "." + f"{sub_key}_{percentile}"] = value
+                        else:
+                            # Likely a sub-bucket
+                            sub_agg_keys.append(sub_key)
+                
+                # Add all metrics to the row
+                new_row.update(metric_values)
+                
+                if sub_agg_keys:
+                    newCurrentPath=[]
+                    if len(current_path)>1 or len(sub_agg_keys)>1:
+                        newCurrentPath = current_path
+                    # Process sub-bucket aggregations
+                    for sub_key in sub_agg_keys:
+                        sub_value = bucket[sub_key]
+                        sub_rows = legacy_process_nested_aggs(
+                            sub_value,
+                            newCurrentPath + [sub_key],
+                            new_row.copy()
+                        )
+                        result_rows.extend(sub_rows)
+                else:
+                    # No sub-buckets, just add this row
+                    result_rows.append(new_row)
+    
+    # Handle the case where we're at a leaf node (metric aggregation)
+    elif "value" in agg_data:
+        # agg_name = ".".join(current_path) if current_path else "value"
+        new_row = current_row.copy()
+        new_row[current_row_name] = agg_data["value"]
+        result_rows.append(new_row)
+    
+    # Handle percentiles
+    elif "values" in agg_data:
+        # agg_name = ".".join(current_path) if current_path else "percentile"
+        new_row = current_row.copy()
+        for percentile, value in agg_data["values"].items():
+            new_row[f"{current_row_name}_{percentile}"] = value
+        result_rows.append(new_row)
+    
+    # If we didn't match any specific aggregation type but have a row, return it
+    elif current_row:
+        result_rows.append(current_row)
+        
+    return result_rows
+
+
+def bucket(key, doc_count, **sub_aggs):
+    return {"key": key, "doc_count": doc_count, **sub_aggs}
+
+
+def nested_terms(leaves, percentiles=False):
+    """terms > date_histogram > terms, a hundredth of the leaves per outer bucket"""
+    outer = max(1, leaves // 1000)
+    days = 100
+    inner = max(1, leaves // (outer * days))
+
+    def leaf(i):
+        metrics = {"avg_price": {"value": i * 0.5}}
+        if percentiles:
+            metrics["price_pct"] = {"values": {"50.0": i * 0.4, "95.0": i * 0.9, "99.0": i * 0.99}}
+        return bucket(f"model {i}", 3, **metrics)
+
+    return {"buckets": [
+        bucket(f"make {m}", 100, by_day={"buckets": [
+            {"key": 1704067200000 + d * 86400000, "key_as_string": f"2024-{d // 28 % 12 + 1:02d}-{d % 28 + 1:02d}",
+             "doc_count": 10, "by_model": {"buckets": [leaf(i) for i in range(inner)]}}
+            for d in range(days)
+        ]})
+        for m in range(outer)
+    ]}
+
+
+def composite(leaves):
+    return {"after_key": {"city": "last", "day": 0}, "buckets": [
+        {"key": {"city": f"city {i % 500}", "day": i // 500}, "doc_count": 2, "total": {"value": i * 1.5}}
+        for i in range(leaves)
+    ]}
+
+
+def siblings(leaves):
+    """terms with two sibling terms and a keyed filters aggregation under every bucket"""
+    outer = max(1, leaves // 100)
+    return {"buckets": [
+        bucket(f"shop {s}", 50,
+               by_product={"buckets": [bucket(f"product {p}", 1, qty={"value": p}) for p in range(50)]},
+               by_channel={"buckets": [bucket(f"channel {c}", 1) for c in range(48)]},
+               status={"buckets": {"paid": {"doc_count": 40}, "refunded": {"doc_count": 10}}})
+        for s in range(outer)
+    ]}
+
+
+def legacy_table(agg_name, agg_data):
+    return pd.DataFrame(legacy_process_nested_aggs(agg_data, [agg_name]))
+
+
+def columnar_table(agg_name, agg_data):
+    return pa.table({name: column_array(values) for name, values in flatten_aggs(agg_name, agg_data).items()})
+
+
+def timed(func, agg_data, repeat=3):
+    """Best of repeat runs and the number of rows"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        table = func("top", agg_data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(table)
+
+
+def main():
+    leaves = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    cases = {
+        "nested terms": nested_terms(leaves),
+        "nested pct": nested_terms(leaves, percentiles=True),
+        "composite": composite(leaves),
+        "siblings": siblings(leaves),
+    }
+    print(f"about {leaves} leaf buckets per case")
+    for name, agg_data in cases.items():
+        try:
+            legacy, legacy_rows = timed(legacy_table, agg_data)
+            legacy_text = f"{legacy:7.3f}s {legacy_rows:>8} rows"
+        except Exception as e:
+            legacy = None
+            legacy_text = f"fails ({type(e).__name__})".ljust(23)
+        columnar, rows = timed(columnar_table, agg_data)
+        speedup = f"  {legacy / columnar:5.1f}x" if legacy else ""
+        print(f"{name:<14} legacy {legacy_text}  columnar {columnar:7.3f}s {rows:>8} rows{speedup}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Measure the assistant loop (generate queries, run one, render the result) offline.
+
+multTableBot.py runs under streamlit's AppTest against a generated sqlite
+database, with llm_backend = "stub" so the timings only depend on the stub
+latency and the local work. Run from the repository root:
+    python -m benchmarks.benchmarkAssistant 20 0.5
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+from llmClient import StubBackend
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_database(db_file, rows):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "Order ID": np.arange(rows),
+        "Customer Name": rng.choice(["Alice", "Bob", "Carol", "Dave"], rows),
+        "City": rng.choice(["Sydney", "Melbourne", "Perth"], rows),
+        "Amount": rng.uniform(1, 1000, rows).round(2),
+    })
+    with sqlite3.connect(db_file) as conn:
+        df.to_sql("orders", conn, index=False)
+
+
+def write_env(directory, latency):
+    settings = {
+        "path": directory,
+        "index_name": "benchmark",
+        "database_name_sqlite": os.path.join(directory, "benchmark.sqlite"),
+        "llm_backend": "stub",
+        "llm_stub_latency": latency,
+        # Every request goes to the backend instead of the on-disk LLM cache
+        "llm_cache_ttl": 0,
+    }
+    with open(os.path.join(directory, ".env"), "w") as f:
+        for key, value in settings.items():
+            f.write(f'{key}="{value}"\n')
+
+
+def click(app, label):
+    next(button for button in app.button if button.label == label).click()
+    start = time.perf_counter()
+    app.run()
+    return time.perf_counter() - start
+
+
+def percentiles(label, timings):
+    timings = np.array(timings)
+    print(
+        f"{label:<10} p50 {np.percentile(timings, 50):7.3f}s  p95 {np.percentile(timings, 95):7.3f}s"
+        f"  mean {timings.mean():7.3f}s"
+    )
+
+
+def run_loop(iterations):
+    app = AppTest.from_file(os.path.join(ROOT, "multTableBot.py"), default_timeout=60).run()
+    generate, execute = [], []
+    start = time.perf_counter()
+    for i in range(iterations):
+        app.text_area[-1].input(f"Which cities spend the most, request {i}")
+        generate.append(click(app, "Generate Custom Queries"))
+        if app.exception or not app.session_state.custom_queries:
+            raise RuntimeError(f"No queries generated: {[e.value for e in app.exception]}")
+        execute.append(click(app, "Run Query"))
+    elapsed = time.perf_counter() - start
+    percentiles("generate", generate)
+    percentiles("run", execute)
+    print(f"loop       {iterations / elapsed:7.2f} requests/sec")
+
+
+def run_fan_out(prompts, latency):
+    backend = StubBackend(latency=latency)
+    payloads = [{"model": "stub", "messages": [{"role": "system", "content": "SQL"}]}] * prompts
+    start = time.perf_counter()
+    for payload in payloads:
+        backend.complete(payload)
+    sequential = time.perf_counter() - start
+    start = time.perf_counter()
+    backend.complete_many(payloads)
+    parallel = time.perf_counter() - start
+    print(f"fan-out    {prompts} prompts  sequential {sequential:7.3f}s  parallel {parallel:7.3f}s")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    rows = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+    print(f"{iterations} requests, {latency}s stub latency, {rows} rows")
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_database(os.path.join(directory, "benchmark.sqlite"), rows)
+        write_env(directory, latency)
+        # The bots read .env from the working directory
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            run_loop(iterations)
+        finally:
+            os.chdir(cwd)
+    run_fan_out(8, latency)
+
+
+if __name__ == "__main__":
+    main()
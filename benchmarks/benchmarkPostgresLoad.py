@@ -0,0 +1,86 @@
+"""
+Compare pandas to_sql with the COPY loader on a generated multi-million-row CSV.
+
+Needs a local PostgreSQL instance, the connection settings are read from .env
+like uploadToPostgres.py. Run from the repository root:
+    python -m benchmarks.benchmarkPostgresLoad 2000000
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import psycopg2
+from dotenv import dotenv_values
+from sqlalchemy import create_engine
+from sqlLoad import copy_csv_to_postgres, clean_columns
+
+
+def make_csv(rows, csv_file):
+    rng = np.random.default_rng(0)
+    chunk = 500000
+    for start in range(0, rows, chunk):
+        size = min(chunk, rows - start)
+        df = pd.DataFrame({
+            "Order ID": np.arange(start, start + size),
+            "Customer Name": rng.choice(["Alice", "Bob", "Carol", "Dave"], size),
+            "City": rng.choice(["Sydney", "Melbourne", "Perth"], size),
+            "Amount": rng.uniform(1, 1000, size).round(2),
+            "Order_Date": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1500, size), unit="D"),
+        })
+        df["Order_Date"] = df["Order_Date"].dt.strftime("%m/%d/%Y")
+        df.to_csv(csv_file, mode="a" if start else "w", header=not start, index=False)
+
+
+def order_dates(df):
+    if "Order_Date" in df:
+        df["Order_Date"] = pd.to_datetime(df["Order_Date"], format="%m/%d/%Y", errors="coerce").dt.date
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    config = dotenv_values(".env")
+    credentials = dict(
+        host=config["database_host"],
+        port=config["database_port"],
+        user=config["database_user"],
+        password=config["database_password"],
+        dbname=config["database_name_postgres"],
+    )
+
+    csv_file = os.path.join(tempfile.mkdtemp(), "orders.csv")
+    make_csv(rows, csv_file)
+    print(f"{rows} rows, {os.path.getsize(csv_file) / 2**20:.0f} MiB csv")
+
+    engine = create_engine(
+        "postgresql+psycopg2://{user}:{password}@{host}:{port}/{dbname}".format(**credentials)
+    )
+    start = time.perf_counter()
+    df = pd.read_csv(csv_file)
+    clean_columns(df)
+    order_dates(df)
+    with engine.begin() as connection:
+        df.to_sql("benchmark_to_sql", connection, if_exists="replace", index=False, chunksize=10000)
+    to_sql = time.perf_counter() - start
+    del df
+    engine.dispose()
+    print(f"to_sql  {to_sql:8.1f}s  {rows / to_sql:10.0f} rows/sec")
+
+    conn = psycopg2.connect(**credentials)
+    start = time.perf_counter()
+    copy_csv_to_postgres(conn, csv_file, "benchmark_copy", mutate=order_dates)
+    conn.commit()
+    copy = time.perf_counter() - start
+    print(f"copy    {copy:8.1f}s  {rows / copy:10.0f} rows/sec")
+    print(f"speedup {to_sql / copy:8.1f}x")
+
+    with conn.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS benchmark_to_sql, benchmark_copy")
+    conn.commit()
+    conn.close()
+    os.remove(csv_file)
+
+
+if __name__ == "__main__":
+    main()
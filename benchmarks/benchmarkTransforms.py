@@ -0,0 +1,66 @@
+"""
+Compare the declarative Mappy transforms with the old row-wise apply mappers.
+
+Run from the repository root:
+    python -m benchmarks.benchmarkTransforms 1000000
+"""
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from mappy import Mappy, GeoPoint, ParseDate
+
+
+def legacy_location(df):
+    df["location"] = df.apply(lambda row: {"lat": float(row["lat"]), "lon": float(row["lng"])}, axis=1)
+
+
+def legacy_dates(df):
+    def convert_date_time(date_time_str):
+        try:
+            date_time_obj = datetime.strptime(date_time_str, "%m/%d/%y, %I:%M %p")
+            return date_time_obj.isoformat()
+        except ValueError:
+            return None
+    df["Trim Created"] = df["Trim Created"].apply(convert_date_time)
+
+
+class DeclarativeMappy(Mappy):
+    transforms = [
+        GeoPoint("location", lat="lat", lon="lng"),
+        ParseDate("Trim Created", format="%m/%d/%y, %I:%M %p"),
+    ]
+
+
+def make_frame(rows):
+    rng = np.random.default_rng(0)
+    dates = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 10**8, rows), unit="s")
+    return pd.DataFrame({
+        "lat": rng.uniform(-44, -10, rows),
+        "lng": rng.uniform(113, 154, rows),
+        "Trim Created": dates.strftime("%m/%d/%y, %I:%M %p"),
+    })
+
+
+def timed(label, func, df):
+    df = df.copy()
+    start = time.perf_counter()
+    func(df)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed:8.3f}s  {len(df) / elapsed:12.0f} rows/sec")
+    return elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    df = make_frame(rows)
+    print(f"{rows} rows")
+
+    legacy = timed("apply", lambda frame: (legacy_location(frame), legacy_dates(frame)), df)
+    declarative = timed("declarative", DeclarativeMappy().additionalColumn, df)
+    print(f"speedup      {legacy / declarative:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import queue
+import sqlite3
+import time
+from contextlib import contextmanager
+import streamlit as st
+from elasticsearch import Elasticsearch
+from sqlalchemy import create_engine
+
+
+# Seconds between Elasticsearch pings, so a rerun does not pay a round-trip for the check
+HEALTH_CHECK_INTERVAL = 30
+_last_checked = {}
+
+
+@st.cache_resource
+def _es_client(hosts, username, password, connections_per_node):
+    return Elasticsearch(
+        hosts=list(hosts),
+        basic_auth=(username, password),  # If authentication is required
+        verify_certs=False,  # Set to False to disable SSL certificate verification
+        connections_per_node=connections_per_node,
+        retry_on_timeout=True,
+    )
+
+
+def get_es_client(config):
+    """
+    Elasticsearch client shared by every rerun and session of this process.
+
+    The client is pinged at most every HEALTH_CHECK_INTERVAL seconds and
+    recreated when the ping fails.
+    """
+    args = (
+        ("https://localhost:9200",),
+        config["elasticsearch_username"],
+        config["elasticsearch_password"],
+        int(config.get("es_connections", 10)),
+    )
+    client = _es_client(*args)
+    now = time.monotonic()
+    if now - _last_checked.get("elasticsearch", 0) >= HEALTH_CHECK_INTERVAL:
+        _last_checked["elasticsearch"] = now
+        try:
+            healthy = client.ping()
+        except Exception:
+            healthy = False
+        if not healthy:
+            print("Elasticsearch ping failed, reconnecting")
+            _es_client.clear()
+            client = _es_client(*args)
+    return client
+
+
+@st.cache_resource
+def get_engine(url, pool_size=5, max_overflow=5):
+    """
+    SQLAlchemy engine shared by every rerun and session of this process.
+
+    pool_pre_ping checks each connection on checkout and replaces dead ones,
+    pool_recycle drops connections before server side idle timeouts hit them.
+    """
+    return create_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+    )
+
+
+class SqlitePool:
+    """
+    sqlite connections handed out to one thread at a time.
+
+    Up to size connections are kept open. When all of them are busy for
+    wait seconds, for example because several sessions run at once, an
+    extra connection is opened instead of blocking, and closed when it is
+    released.
+    """
+
+    def __init__(self, db_file, size, wait=1.0):
+        self.db_file = db_file
+        self.wait = wait
+        self.connections = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self.connections.put(self._connect())
+
+    def _connect(self):
+        # Connections move between threads, the pool makes sure only one uses them at a time
+        return sqlite3.connect(self.db_file, check_same_thread=False)
+
+    def acquire(self):
+        try:
+            conn = self.connections.get(timeout=self.wait)
+        except queue.Empty:
+            return self._connect()
+        try:
+            conn.execute("SELECT 1")
+        except sqlite3.Error:
+            conn = self._connect()
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self.connections.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+
+@st.cache_resource
+def get_sqlite_pool(db_file, size=5):
+    """sqlite connection pool shared by every rerun and session of this process"""
+    return SqlitePool(db_file, size)
@@ -1,157 +1,243 @@
-import pandas as pd
+import pyarrow as pa
+from arrowResults import column_array, es_hits_table
 
 
-def process_nested_aggs(agg_data, current_path=None, current_row=None):
+# What a value inside a bucket is, decided once per aggregation level and name
+_SKIP, _VALUE, _VALUES, _STATS, _BUCKETS, _SINGLE = range(6)
+# Bucket fields that are not sub-aggregations, from, to and other scalars are skipped by type
+_BUCKET_FIELDS = {"key", "key_as_string", "doc_count", "meta"}
+# Marks the bucket of a single-bucket aggregation (filter, nested, global, missing), it has no key column
+_NO_KEY = object()
+_END = object()
+
+
+def _kind(name, value):
+    if name in _BUCKET_FIELDS or not isinstance(value, dict):
+        return _SKIP
+    if "buckets" in value:
+        return _BUCKETS
+    if "value" in value:
+        return _VALUE
+    if "values" in value:
+        return _VALUES
+    if "doc_count" in value:
+        return _SINGLE
+    if "hits" in value:
+        # top_hits documents do not fit in a row
+        return _SKIP
+    return _STATS
+
+
+def _metric_values(kind, value):
+    """(suffix, value) pairs of a percentiles or stats style metric"""
+    if kind == _VALUES:
+        values = value["values"]
+        if isinstance(values, list):
+            # keyed: false percentiles
+            return [(item["key"], item.get("value")) for item in values]
+        return values.items()
+    return [(stat, stat_value) for stat, stat_value in value.items() if not isinstance(stat_value, (dict, list))]
+
+
+def _put(column, row, value):
+    """Set row of a column list, padding the rows it has no value for with None"""
+    filled = len(column)
+    if filled == row:
+        column.append(value)
+    elif filled < row:
+        column.extend([None] * (row - filled))
+        column.append(value)
+    else:
+        # The same column twice in a row, the later value wins
+        column[row] = value
+
+
+class _Level:
     """
-    Recursively process nested aggregations and create rows for each combination.
-    
-    Args:
-        agg_data: The current aggregation data to process
-        current_path: List tracking the current path in the aggregation hierarchy
-        current_row: Dictionary representing the current row being built
-        
+    Columns of one aggregation level, looked up once and shared by all its buckets.
+
+    A chain of single sub-aggregations keeps plain names. Below a level with
+    several bucket sub-aggregations names are joined with dots from the
+    second aggregation of the path on.
+    """
+
+    __slots__ = ("path", "agg_name", "name", "table", "children", "lists", "plans", "sources", "key_column", "count_column")
+
+    def __init__(self, path, table):
+        self.path = path
+        self.agg_name = ".".join(path[1:])
+        self.name = self.agg_name or path[-1]
+        self.table = table
+        self.children = {}
+        self.lists = {}
+        self.plans = {}
+        self.sources = {}
+        # Created with the first bucket that has a key or a count, so columns keep the order they first appear in
+        self.key_column = None
+        self.count_column = None
+
+    def child(self, name, siblings):
+        level = self.children.get((name, siblings))
+        if level is None:
+            path = self.path + [name] if len(self.path) > 1 or siblings > 1 else [name]
+            level = self.children[(name, siblings)] = _Level(path, self.table)
+        return level
+
+    def own(self, label):
+        """Column list of a column named label as is"""
+        column = self.lists.get(label)
+        if column is None:
+            column = self.lists[label] = self.table.setdefault(label, [])
+        return column
+
+    def keys(self):
+        if self.key_column is None:
+            self.key_column = self.own(self.name)
+        return self.key_column
+
+    def counts(self):
+        if self.count_column is None:
+            self.count_column = self.own(f"{self.name}_count")
+        return self.count_column
+
+    def plan(self, name, value):
+        """
+        (kind, column) of the value called name in this level's buckets.
+
+        column is the column list of a single value metric, or a dict of
+        suffix to column list that percentiles and stats fill as they go.
+        """
+        plan = self.plans.get(name)
+        if plan is None:
+            kind = _kind(name, value)
+            plan = self.plans[name] = (kind, self.column(name) if kind == _VALUE else {})
+        return plan
+
+    def column(self, name, suffix=None):
+        """Column list of a metric, or of a composite source, inside this level's buckets"""
+        column = self.lists.get((name, suffix))
+        if column is None:
+            label = name if suffix is None else f"{name}_{suffix}"
+            label = f"{self.agg_name}.{label}" if self.agg_name else label
+            column = self.lists[(name, suffix)] = self.table.setdefault(label, [])
+        return column
+
+
+def flatten_aggs(agg_name, agg_data):
+    """
+    Flatten one aggregation result into columns, a row per leaf bucket.
+
+    Walks the buckets with an explicit stack. A leaf bucket appends its
+    values to the column lists, a parent bucket fills its key, count and
+    metrics once over the rows its sub-aggregations produced, so nothing is
+    copied per bucket. Percentiles and stats become one column per value,
+    composite keys one column per source. Sibling bucket aggregations each
+    add their own rows.
+
     Returns:
-        List of dictionaries, each representing a complete row
+        Dict of column name to a list of values, all of the same length
     """
-    if current_path is None:
-        current_path = []
-    if current_row is None:
-        current_row = {}
-            
-    result_rows = []
-    
-    # Get the current aggregation name
-    if current_path:
-        # agg_name = current_path[-1]
-        agg_name = ".".join(current_path[1:])     
-        just_name = current_path[-1] 
-        current_row_name = agg_name if agg_name else just_name   
-    else:
-        # Fallback name if path is empty (shouldn't happen in practice)
-        agg_name = ""
-    
-    
-    # Handle bucket aggregations
-    if "buckets" in agg_data:
-        buckets = agg_data["buckets"]
-        
-        if isinstance(buckets, list):
-            
-            # Process each bucket
-            for bucket in buckets:
-                # Create a new row with the current bucket's data
-                new_row = current_row.copy()
-                new_row[current_row_name] = bucket.get("key_as_string", "") if "key_as_string" in bucket else bucket.get("key", "")
-                new_row[f"{current_row_name}_count"] = bucket.get("doc_count", 0)
-                
-                # Collect all metric aggregations at this level
-                metric_values = {}
-                sub_agg_keys = []
-                
-                for sub_key, sub_value in bucket.items():
-                    if sub_key not in ["key", "doc_count", "key_as_string"]:
-                        if "value" in sub_value:
-                            # This is a metric aggregation - add to current row
-                            row_key = agg_name + "." + sub_key if agg_name else sub_key
-                            metric_values[row_key] = sub_value["value"]
-                        elif "values" in sub_value:
-                            # Handle percentiles
-                            name=f"{sub_key}_{percentile}"
-                            row_key = agg_name + "." + name if agg_name else name
-                            for percentile, value in sub_value["values"].items():
-                                metric_values[row_key] = value
-                        elif "buckets" in sub_value:
-                            # This is a sub-bucket aggregation - process recursively later
-                            sub_agg_keys.append(sub_key)
-                
-                # Add all metrics to the row
-                new_row.update(metric_values)
-                #TODO product decision. To merge the rows, 
-                # you have to collect the sub_rows then call process_nested_aggs on each of the sub_rows
-                # this will multiply the rows with every agg at the same lebel
-                # only at the final subrow do you call result_rows.extend(sub_rows)
-                if sub_agg_keys:
-                    newCurrentPath=[]
-                    if len(current_path)>1 or len(sub_agg_keys)>1:
-                        newCurrentPath = current_path
-             
-                    # Process sub-bucket aggregations
-                    for sub_key in sub_agg_keys:
-                        sub_value = bucket[sub_key]
-                        sub_rows = process_nested_aggs(
-                            sub_value,
-                            newCurrentPath + [sub_key],
-                            new_row.copy()  # Pass the row with metrics already added
-                        )
-                        result_rows.extend(sub_rows)
-                else:
-                    # No sub-buckets, just add this row
-                    result_rows.append(new_row)
-        
-        elif isinstance(buckets, dict):
-            # Handle composite or filters aggregation
-            for key, bucket in buckets.items():
-                new_row = current_row.copy()
-                new_row[current_row_name] = key
-                new_row[f"{current_row_name}_count"] = bucket.get("doc_count", 0)
-                
-                # Collect all metric aggregations at this level
-                metric_values = {}
-                sub_agg_keys = []
-                
-                for sub_key, sub_value in bucket.items():
-                    if sub_key not in ["doc_count"]:
-                        if "value" in sub_value:
-                            # This is a metric aggregation
-                            metric_values[agg_name + "." + sub_key] = sub_value["value"]
-                        elif "values" in sub_value:
-                            # Handle percentiles
-                            for percentile, value in sub_value["values"].items():
-                                metric_values[agg_name + "." + f"{sub_key}_{percentile}"] = value
-                        else:
-                            # Likely a sub-bucket
-                            sub_agg_keys.append(sub_key)
-                
-                # Add all metrics to the row
-                new_row.update(metric_values)
-                
-                if sub_agg_keys:
-                    newCurrentPath=[]
-                    if len(current_path)>1 or len(sub_agg_keys)>1:
-                        newCurrentPath = current_path
-                    # Process sub-bucket aggregations
-                    for sub_key in sub_agg_keys:
-                        sub_value = bucket[sub_key]
-                        sub_rows = process_nested_aggs(
-                            sub_value,
-                            newCurrentPath + [sub_key],
-                            new_row.copy()
-                        )
-                        result_rows.extend(sub_rows)
+    table = {}
+    rows = 0
+
+    def write_row(cells):
+        nonlocal rows
+        for column, value in cells:
+            _put(column, rows, value)
+        rows += 1
+
+    stack = []
+
+    def push(level, value, kind):
+        if kind == _SINGLE:
+            stack.append((level, _NO_KEY, value))
+            return
+        buckets = value["buckets"]
+        if isinstance(buckets, dict):
+            # keyed filters and ranges
+            stack.extend((level, key, bucket) for key, bucket in reversed(buckets.items()))
+        else:
+            stack.extend(
+                (level, bucket["key_as_string"] if "key_as_string" in bucket else bucket.get("key", ""), bucket)
+                for bucket in reversed(buckets)
+            )
+
+    level = _Level([agg_name], table)
+    kind = _kind(agg_name, agg_data)
+    if kind == _VALUE:
+        write_row([(level.own(level.name), agg_data["value"])])
+    elif kind in (_VALUES, _STATS):
+        write_row([(level.own(f"{level.name}_{suffix}"), value) for suffix, value in _metric_values(kind, agg_data)])
+    elif kind in (_BUCKETS, _SINGLE):
+        push(level, agg_data, kind)
+
+    while stack:
+        entry = stack.pop()
+        if entry[0] is _END:
+            _, cells, start = entry
+            if rows == start:
+                # Its sub-aggregations had no buckets, the bucket still gets its own row
+                write_row(cells)
+                continue
+            for column, value in cells:
+                if len(column) < start:
+                    column.extend([None] * (start - len(column)))
+                column[start:rows] = [value] * (rows - start)
+            continue
+
+        level, key, bucket = entry
+        if isinstance(key, dict):
+            # composite, one column per source
+            cells = []
+            sources = level.sources
+            for source, source_key in key.items():
+                column = sources.get(source)
+                if column is None:
+                    column = sources[source] = level.column(source)
+                cells.append((column, source_key))
+        elif key is not _NO_KEY:
+            cells = [(level.key_column if level.key_column is not None else level.keys(), key)]
+        else:
+            cells = []
+        cells.append((level.count_column if level.count_column is not None else level.counts(), bucket.get("doc_count", 0)))
+
+        children = None
+        plans = level.plans
+        for name, value in bucket.items():
+            kind, column = plans.get(name) or level.plan(name, value)
+            if kind == _VALUE:
+                cells.append((column, value["value"]))
+            elif kind == _SKIP:
+                continue
+            elif kind == _VALUES or kind == _STATS:
+                for suffix, metric in _metric_values(kind, value):
+                    target = column.get(suffix)
+                    if target is None:
+                        target = column[suffix] = level.column(name, suffix)
+                    cells.append((target, metric))
+            elif children is None:
+                children = [(name, value, kind)]
+            else:
+                children.append((name, value, kind))
+
+        if children is None:
+            # Leaf bucket, the columns are usually filled up to this row already
+            for column, value in cells:
+                if len(column) == rows:
+                    column.append(value)
                 else:
-                    # No sub-buckets, just add this row
-                    result_rows.append(new_row)
-    
-    # Handle the case where we're at a leaf node (metric aggregation)
-    elif "value" in agg_data:
-        # agg_name = ".".join(current_path) if current_path else "value"
-        new_row = current_row.copy()
-        new_row[current_row_name] = agg_data["value"]
-        result_rows.append(new_row)
-    
-    # Handle percentiles
-    elif "values" in agg_data:
-        # agg_name = ".".join(current_path) if current_path else "percentile"
-        new_row = current_row.copy()
-        for percentile, value in agg_data["values"].items():
-            new_row[f"{current_row_name}_{percentile}"] = value
-        result_rows.append(new_row)
-    
-    # If we didn't match any specific aggregation type but have a row, return it
-    elif current_row:
-        result_rows.append(current_row)
-        
-    return result_rows
+                    _put(column, rows, value)
+            rows += 1
+            continue
+        stack.append((_END, cells, rows))
+        siblings = len(children)
+        for name, value, kind in reversed(children):
+            push(level.child(name, siblings), value, kind)
+
+    for column in table.values():
+        if len(column) < rows:
+            column.extend([None] * (rows - len(column)))
+    return table
 
 
 def createTableInStreamlit(st, results):
@@ -162,26 +248,24 @@ def createTableInStreamlit(st, results):
             # st.subheader(f"Aggregation: {agg_name}")
             
             # Process this aggregation and all its nested aggregations
-            rows = process_nested_aggs(agg_data, [agg_name])
-            if rows:
-                df = pd.DataFrame(rows)
-                st.dataframe(df)
+            columns = flatten_aggs(agg_name, agg_data)
+            if columns:
+                table = pa.table({name: column_array(values) for name, values in columns.items()})
+                st.dataframe(table)
             else:
                 st.write("No data in aggregation")
 
     # Check if we have hits
     if "hits" in results and results["hits"]["hits"]:    
-        # TODO decide isinstance(results["hits"]["hits"], list)    
         # st.write("Search Results")
         hits = results["hits"]["hits"]
-        extracted_data = [hit["_source"] for hit in hits]
 
-        # Convert to a pandas DataFrame
-        df = pd.DataFrame(extracted_data)
+        # Decode the _source column by column into an Arrow table, st.dataframe sends it as is
+        table = es_hits_table(hits)
 
-        # Display the DataFrame as a table
+        # Display the table
         # st.write(f"Found {results['hits']['total']['value']} documents:")
-        st.dataframe(df)
+        st.dataframe(table)
 
 
 # def visualize_aggregation(st, agg_name, agg_data):
@@ -1,32 +1,56 @@
 import streamlit as st
 import json
 import os
-from elasticsearch import Elasticsearch
 from datetime import datetime
 from dotenv import dotenv_values
 import requests
 import pandas as pd
 from createTable import createTableInStreamlit
+from resultCache import get_result_cache, get_generation, es_fingerprint
+from connections import get_es_client
+from schemaIntrospection import get_es_mapping
+from llmCache import get_llm_cache
+from llmClient import get_llm_client, parse_queries
+from schemaSummary import summarize_es_mapping
+from queryCost import cost_budget, estimate_es_query
+from queryGuard import es_truncation, guard_es_query, limits_for
+from pagination import EsPager, get_pager, show_pages
 
 
 config = dotenv_values(".env")
 
 dir = config["path"]
-# set up deepseek
-API_KEY = config["API_KEY"]
-API_URL = config["API_URL"]
-headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
+# set up the query assistant, llm_backend in .env picks the API or the local stub
+model = config.get("model", "deepseek/deepseek-chat:free")
+# Generated queries are kept on disk and reused for the same request, model and schema
+llm_cache = get_llm_cache(config)
+# Generated queries are streamed and shown as they arrive unless llm_streaming is false
+llm_streaming = config.get("llm_streaming", "true").lower() == "true"
+# Several comma separated models get the same request in parallel, their queries are listed together
+models = [name.strip() for name in config.get("models", model).split(",") if name.strip()]
+# Pooled, retrying client with a limit on requests in flight
+llm_client = get_llm_client(config)
+# The prompt gets a ranked schema summary trimmed to this many tokens instead of the raw schema
+schema_token_budget = int(config.get("schema_token_budget", 1500))
+schema_stats = config.get("schema_stats", "true").lower() == "true"
+schema_sample_size = int(config.get("schema_sample_size", 1000))
+# Generated queries are estimated before they run, "reject" blocks the ones over budget, "warn" only shows it
+cost_gate = config.get("cost_gate", "reject")
+budget = cost_budget(config)
+# Every query gets size, timeout and track_total_hits caps, saved widgets can override them
+default_limits = limits_for(config)
+# Hits are paged through a point in time, page_size hits at a time
+page_size = int(config.get("page_size", 100))
+pit_keep_alive = config.get("pit_keep_alive", "5m")
 widgetJsonPath = dir + "/" + config["index_name"] + "_saved_widgets.json"
-es = Elasticsearch(
-    hosts=["https://localhost:9200"],
-    basic_auth=(
-        config["elasticsearch_username"],
-        config["elasticsearch_password"],
-    ),  # If authentication is required
-    verify_certs=False,  # Set to False to disable SSL certificate verification
-)
+# Widget results are reused until their ttl (seconds) runs out or new data is uploaded
+default_ttl = int(config.get("cache_ttl", 300))
+result_cache = get_result_cache(int(config.get("cache_max_entries", 256)))
+# Reused across reruns instead of connecting again on every interaction
+es = get_es_client(config)
 
-mapping = es.indices.get_mapping(index=config["index_name"])
+# Only fetched again when the index's mapping version changes
+mapping = get_es_mapping(es, config["index_name"])
 
 
 # Sidebar with table that follows as you scroll
@@ -59,8 +83,17 @@ if "saved_widgets" not in st.session_state:
         st.session_state.saved_widgets = []
 
 
-def get_chat_response(mapping, request):
-
+def chat_messages(mapping, request):
+    summary = summarize_es_mapping(
+        es,
+        config["index_name"],
+        mapping,
+        request,
+        budget=schema_token_budget,
+        generation=get_generation(dir, "elasticsearch", config["index_name"]),
+        stats=schema_stats,
+        sample_size=schema_sample_size,
+    )
     system_prompt = f"""
     You are a senior data analyst. Your client wants to understand more about their data. This is their request.
     Request:
@@ -68,11 +101,11 @@ def get_chat_response(mapping, request):
     
     From the request, generate 3 useful Elasticsearch queries. Return only JSON format with query_name and Elasticsearch query_body. Each of them should be on a new line. 
     
-    Below is the index mapping you can use to query on:
-    {mapping}
+    Below are the index fields you can use to query on, with their type, distinct values and a range or examples:
+    {summary}
     """
 
-    messages_with_context = [
+    return [
         {
             "role": "system",
             "content": "You are a data analyst specializing in Elasticsearch.",
@@ -80,50 +113,133 @@ def get_chat_response(mapping, request):
         {"role": "system", "content": system_prompt},
     ]
 
-    # Define the request payload (data)
-    data = {
-        "model": "deepseek/deepseek-chat:free",
-        "messages": messages_with_context,
-    }
 
-    # Send the POST request to the DeepSeek API
-    response = requests.post(API_URL, json=data, headers=headers)
+def parse_response(content):
+    ans = []
+    for query in parse_queries(content):
+        print(f"Query name: {query['query_name']}")
+        print(f"Query body: {json.dumps(query['query_body'], indent=2)}")
+        ans.append((query["query_name"], query["query_body"]))
+    return ans
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        print("API Response:", response.json()["choices"][0]["message"]["content"])
-        response = response.json()["choices"][0]["message"]["content"]
 
-        json_objects = response.strip().split("\n")
-        # Parse each line as a JSON object
-        queries = []
+def get_chat_responses(mapping, prompts):
+    """
+    Answer several (model, request) prompts at once, the uncached ones are sent to the API in parallel.
+
+    Returns:
+        A list of (query_name, query_body) lists in the order of prompts
+    """
+    results = [llm_cache.get("elasticsearch", name, request, mapping) for name, request in prompts]
+    missing = [i for i, cached in enumerate(results) if cached is None]
+    if len(missing) < len(prompts):
+        print("Using cached API response")
+
+    # Define the request payloads (data)
+    payloads = [
+        {"model": prompts[i][0], "messages": chat_messages(mapping, prompts[i][1])}
+        for i in missing
+    ]
+    for i, content in zip(missing, llm_client.complete_many(payloads)):
+        results[i] = parse_response(content) if content else []
+        llm_cache.put("elasticsearch", prompts[i][0], prompts[i][1], mapping, results[i])
+    return results
+
+
+def get_chat_response(mapping, request):
+    return get_chat_responses(mapping, [(model, request)])[0]
 
-        for obj in json_objects:
-            try:
-                response = json.loads(obj)
-                queries.append(response)
-            except:
-                pass
-
-        ans = []
-        # Now you can work with the parsed queries
-        for query in queries:
-            if "query_name" not in query or "query_body" not in query:
-                continue
-            print(f"Query name: {query['query_name']}")
-            print(f"Query body: {json.dumps(query['query_body'], indent=2)}")
-            ans.append((query["query_name"], query["query_body"]))
-        return ans
-    else:
-        print("Failed to fetch data from API. Status Code:", response.status_code)
-        return []
 
-    # return queries
+def stream_chat_response(mapping, request):
+    """Yield (query_name, query_body) tuples as soon as each one is complete in the streamed answer"""
+    cached = llm_cache.get("elasticsearch", model, request, mapping)
+    if cached is not None:
+        print("Using cached API response")
+        yield from cached
+        return
 
+    data = {
+        "model": model,
+        "messages": chat_messages(mapping, request),
+    }
+    ans = []
+    for query in llm_client.stream_queries(data):
+        ans.append((query["query_name"], query["query_body"]))
+        yield ans[-1]
+    llm_cache.put("elasticsearch", model, request, mapping, ans)
+
+
+def generate_queries(request):
+    """
+    Ask the assistant for queries, showing each one as soon as it arrives.
 
-def execute_query(query_body):
-    """Execute an Elasticsearch query and return results"""
+    The preview is cleared at the end, the caller renders the editable version.
+    """
+    if len(models) > 1:
+        responses = get_chat_responses(mapping, [(name, request) for name in models])
+        return [
+            (f"{query_name} ({name})", query_body)
+            for name, queries in zip(models, responses)
+            for query_name, query_body in queries
+        ]
+    if not llm_streaming:
+        return get_chat_response(mapping, request)
+
+    preview = st.empty()
+    container = preview.container()
+    queries = []
+    try:
+        for query_name, query_body in stream_chat_response(mapping, request):
+            queries.append((query_name, query_body))
+            container.markdown(f"**{query_name}**")
+            container.code(json.dumps(query_body, indent=2), language="json")
+    except requests.RequestException as e:
+        st.error(f"The query assistant did not answer: {str(e)}")
+    preview.empty()
+    return queries
+
+
+def estimate_query(query_body):
+    """Cost estimate of a query, cached like widget results"""
+    key = (
+        "cost",
+        config["index_name"],
+        es_fingerprint(query_body),
+        get_generation(dir, "elasticsearch", config["index_name"]),
+    )
+    estimate = result_cache.get(key)
+    if estimate is None:
+        estimate = estimate_es_query(es, config["index_name"], query_body, budget)
+        result_cache.put(key, estimate, default_ttl)
+    return estimate
+
+
+def gate_query(query_body):
+    """
+    Show the cost estimate of a generated query before it can run.
 
+    Returns:
+        The query to run, rewritten when it had to be shrunk to fit the budget,
+        or None when cost_gate is "reject" and it is still over budget
+    """
+    if cost_gate == "off":
+        return query_body
+    estimate = estimate_query(query_body)
+    st.caption(estimate.summary())
+    if estimate.rewrites:
+        st.caption("Rewritten to fit the budget: " + ", ".join(estimate.rewrites))
+    if estimate.over_budget:
+        if cost_gate == "reject":
+            st.error("Not run: " + "; ".join(estimate.reasons))
+            return None
+        st.warning("; ".join(estimate.reasons))
+    return estimate.query
+
+
+def execute_query(query_body, limits=None):
+    """Execute an Elasticsearch query within the result size and timeout limits and return results"""
+
+    query_body = guard_es_query(query_body, limits or default_limits)
     try:
         results = es.search(index=config["index_name"], body=query_body)
         print(query_body)
@@ -137,6 +253,90 @@ def execute_query(query_body):
         return []
 
 
+def execute_queries(query_bodies, ttls=None, limits=None):
+    """
+    Execute several Elasticsearch queries in a single _msearch round-trip.
+
+    Each body is capped by the matching entry of limits (defaults to the .env
+    limits). Results still in the cache are not sent again, successful ones are
+    cached for the matching entry of ttls (seconds, defaults to cache_ttl).
+
+    Returns:
+        List with one (results, error) tuple per query body, in the same order.
+        error is None on success, otherwise results is [] like execute_query.
+    """
+    if not query_bodies:
+        return []
+    ttls = ttls or [default_ttl] * len(query_bodies)
+    limits = limits or [default_limits] * len(query_bodies)
+    query_bodies = [guard_es_query(query_body, limit) for query_body, limit in zip(query_bodies, limits)]
+
+    generation = get_generation(dir, "elasticsearch", config["index_name"])
+    keys = [
+        ("elasticsearch", config["index_name"], es_fingerprint(query_body), generation)
+        for query_body in query_bodies
+    ]
+    batch = [None] * len(query_bodies)
+    misses = []
+    for i, key in enumerate(keys):
+        cached = result_cache.get(key)
+        if cached is not None:
+            batch[i] = (cached, None)
+        else:
+            misses.append(i)
+    if not misses:
+        return batch
+
+    searches = []
+    for i in misses:
+        searches.append({"index": config["index_name"]})
+        searches.append(query_bodies[i])
+
+    try:
+        responses = es.msearch(searches=searches)["responses"]
+    except Exception as e:
+        # The whole request failed, report it on every widget
+        error = e.info if hasattr(e, "info") else str(e)
+        for i in misses:
+            batch[i] = ([], error)
+        return batch
+
+    for i, response in zip(misses, responses):
+        if "error" in response:
+            batch[i] = ([], response["error"])
+        else:
+            result_cache.put(keys[i], response, ttls[i])
+            batch[i] = (response, None)
+    return batch
+
+
+def show_truncation(results):
+    """Say when a result was cut off by the size, timeout or terminate_after limits"""
+    message = es_truncation(results)
+    if message:
+        st.caption(message)
+
+
+def show_hit_pages(query_body, key):
+    """Page through every hit of query_body, only the page being viewed and the next one are fetched"""
+    try:
+        pager = get_pager(
+            st.session_state,
+            key,
+            es_fingerprint(query_body),
+            lambda: EsPager(es, config["index_name"], guard_es_query(query_body, default_limits), page_size, pit_keep_alive),
+        )
+        show_pages(st, pager, key)
+    except Exception as e:
+        st.error(f"Error paging through hits: {str(e)}")
+
+
+def show_query_error(error):
+    """Report the error of one widget's query from an _msearch batch"""
+    st.error("Elasticsearch query error")
+    st.error(f"Elasticsearch error details: {json.dumps(error, indent=2)}") #print formatted error info
+
+
 def save_widget(query_name, query_body):
     """Save a widget to the JSON file"""
     widget = {
@@ -191,6 +391,12 @@ def displayDashboard(st):
         num_cols = 2  # Adjust based on your preference
         grid_cols = st.columns(num_cols)
 
+        # Run every widget query in one _msearch instead of one search per widget
+        batch = execute_queries(
+            [widget["query"] for widget in st.session_state.saved_widgets],
+            [widget.get("ttl", default_ttl) for widget in st.session_state.saved_widgets],
+            [limits_for(config, widget) for widget in st.session_state.saved_widgets],
+        )
         
         for i, widget in enumerate(st.session_state.saved_widgets):
             # Determine which column to place this widget in
@@ -223,9 +429,12 @@ def displayDashboard(st):
                             json.dump(st.session_state.saved_widgets, f)
                         st.rerun()
                 
-                # Execute query and display results directly below the title row
-                results = execute_query(widget["query"])
+                # Display results directly below the title row
+                results, error = batch[i]
+                if error:
+                    show_query_error(error)
                 createTableInStreamlit(st, results)
+                show_truncation(results)
                 
                 st.markdown("---")
                 
@@ -235,11 +444,19 @@ def displayWidgetsInDropdown(st):
 # Display saved widgets at the top
     if st.session_state.saved_widgets:
         st.header("Saved Widgets")
+        batch = execute_queries(
+            [widget["query"] for widget in st.session_state.saved_widgets],
+            [widget.get("ttl", default_ttl) for widget in st.session_state.saved_widgets],
+            [limits_for(config, widget) for widget in st.session_state.saved_widgets],
+        )
         for i, widget in enumerate(st.session_state.saved_widgets):
             with st.expander(f"{widget['name']} (Saved on {widget['saved_at']})"):
                 st.json(widget["query"])
-                results = execute_query(widget["query"])
+                results, error = batch[i]
+                if error:
+                    show_query_error(error)
                 createTableInStreamlit(st, results)
+                show_truncation(results)
 
                 # Option to remove from saved widgets
                 if st.button(f"Remove Widget", key=f"remove_{i}"):
@@ -261,8 +478,8 @@ def main():
     st.header("Top 3 Suggested Queries")
     if st.button("Generate Top Queries"):
         with st.spinner("Generating queries with smartRussell..."):
-            top_queries = get_chat_response(
-                mapping, "Suggest the top queries that will be useful for the data"
+            top_queries = generate_queries(
+                "Suggest the top queries that will be useful for the data"
             )
             print(top_queries)
             st.session_state.top_queries = top_queries
@@ -287,21 +504,29 @@ def main():
                     st.error("Invalid JSON query. Please fix the syntax.")
                     valid = False
 
+                runnable = gate_query(parsed_query) if valid else None
+
                 # Execute query button
-                if st.button(f"Run Query", key=f"top_run_{i}") and valid:
+                if st.button(f"Run Query", key=f"top_run_{i}", disabled=runnable is None):
                     with st.spinner("Executing query..."):
                         try:
-                            results = execute_query(parsed_query)
+                            results = execute_query(runnable)
                             createTableInStreamlit(st, results)
+                            show_truncation(results)
                         except:
                             valid = False
 
+                if runnable is not None and st.toggle("Page through all hits", key=f"top_pages_toggle_{i}"):
+                    show_hit_pages(runnable, f"top_pages_{i}")
+
                 # Save widget button
                 if st.button(f"Save Widget", key=f"top_save_{i}"):
                     if not valid:
                         st.error("Cannot save. Error in query")
+                    elif runnable is None:
+                        st.error("Cannot save. The query is over the cost budget")
                     else:
-                        save_widget(query_name, parsed_query)
+                        save_widget(query_name, runnable)
 
     # Test your own query
     st.header("Test your own query")
@@ -329,9 +554,12 @@ def main():
             try:
                 results = execute_query(parsed_query)
                 createTableInStreamlit(st, results)
+                show_truncation(results)
             except Exception as e:
                 st.error(f"Error executing query: {str(e)}")
                 is_valid_json = False
+    if is_valid_json and st.toggle("Page through all hits", key="own_pages_toggle"):
+        show_hit_pages(parsed_query, "own_pages")
 
     # Save query section
     st.header("Save Query")
@@ -355,7 +583,7 @@ def main():
     if st.button("Generate Custom Queries"):
         if user_input:
             with st.spinner("Generating queries based on your request..."):
-                custom_queries = get_chat_response(mapping, user_input)
+                custom_queries = generate_queries(user_input)
                 st.session_state.custom_queries = custom_queries
         else:
             st.warning("Please enter a description of what you're looking for.")
@@ -376,16 +604,24 @@ def main():
                 try:
                     # Parse the edited query
                     parsed_query = json.loads(edited_query)
+                    runnable = gate_query(parsed_query)
 
                     # Execute query button
-                    if st.button(f"Run Query", key=f"custom_run_{i}"):
+                    if st.button(f"Run Query", key=f"custom_run_{i}", disabled=runnable is None):
                         with st.spinner("Executing query..."):
-                            results = execute_query(parsed_query)
+                            results = execute_query(runnable)
                             createTableInStreamlit(st, results)
+                            show_truncation(results)
+
+                    if runnable is not None and st.toggle("Page through all hits", key=f"custom_pages_toggle_{i}"):
+                        show_hit_pages(runnable, f"custom_pages_{i}")
 
                     # Save widget button
                     if st.button(f"Save Widget", key=f"custom_save_{i}"):
-                        save_widget(query_name, parsed_query)
+                        if runnable is None:
+                            st.error("Cannot save. The query is over the cost budget")
+                        else:
+                            save_widget(query_name, runnable)
 
                 except json.JSONDecodeError:
                     st.error("Invalid JSON query. Please fix the syntax.")
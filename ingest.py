@@ -0,0 +1,290 @@
+import io
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from mappingFactory import MappingFactory
+
+
+def read_csv_chunks(csv_file, chunk_size):
+    """Read the CSV lazily, yielding DataFrames of at most chunk_size rows"""
+    return pd.read_csv(csv_file, chunksize=chunk_size)
+
+
+def _stable_strings(df):
+    """
+    Render every cell as text that does not depend on the dtype pandas inferred.
+
+    The same row can be parsed as 5 in one chunk and 5.0 in another (when the
+    chunk has a missing value), so integral floats are written as integers.
+    """
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_float_dtype(series):
+            integral = series.notna() & (series == np.floor(series)) & np.isfinite(series)
+            text = series.astype(str)
+            text[integral] = series[integral].astype("int64").astype(str)
+        else:
+            text = series.astype(str)
+        columns[col] = text.where(series.notna(), "")
+    return pd.DataFrame(columns)
+
+
+def document_ids(df, id_column=None):
+    """
+    Deterministic document ids for a chunk of raw CSV rows.
+
+    Uses id_column when given, otherwise a 128 bit hash of the row contents,
+    so re-uploading the same CSV overwrites documents instead of duplicating them.
+    Identical rows share an id and end up as one document. Rows missing their
+    id_column value get the row hash too, instead of all sharing one id.
+    """
+    if id_column:
+        # The same key renders the same in every chunk, 5 and not 5.0 when the chunk has a NaN
+        keys = _stable_strings(df[[id_column]])[id_column]
+        missing = df[id_column].isna().to_numpy()
+        if not missing.any():
+            return keys.tolist()
+        hashed = _row_hash_ids(_stable_strings(df[missing]))
+        ids = keys.tolist()
+        for position, doc_id in zip(np.flatnonzero(missing), hashed):
+            ids[position] = doc_id
+        return ids
+
+    return _row_hash_ids(_stable_strings(df))
+
+
+def _row_hash_ids(text):
+    high = row_hashes(text, "dashbot-row-id-1")
+    low = row_hashes(text, "dashbot-row-id-2")
+    return [f"{h:016x}{l:016x}" for h, l in zip(high, low)]
+
+
+def row_hashes(text, hash_key="dashbot-row-hash"):
+    """64 bit hash of every row of a DataFrame produced by _stable_strings"""
+    return pd.util.hash_pandas_object(text, index=False, hash_key=hash_key).to_numpy()
+
+
+def prepare_chunk(df, mappy):
+    """
+    Apply the mapper's column transforms to one chunk and return its documents.
+
+    Args:
+        df: DataFrame holding one chunk of the CSV
+        mappy: Mappy instance for the index
+
+    Returns:
+        List of (document id, document) tuples, one per row
+    """
+    ids = document_ids(df, mappy.idColumn)
+    # Replace NaN with None to avoid issues
+    df = df.replace({np.nan: None})
+    mappy.additionalColumn(df)
+    return list(zip(ids, df.to_dict("records")))
+
+
+def read_csv_blocks(csv_file, chunk_size):
+    """
+    Split the CSV into raw text blocks of about chunk_size rows without parsing it.
+
+    A block is only cut where the quote count is balanced, so quoted fields
+    containing newlines stay in one piece.
+
+    Yields:
+        Tuples of (header, block) that parse_block can turn into documents
+    """
+    with open(csv_file, "r", newline="") as f:
+        header = ""
+        for line in f:
+            header += line
+            if header.count('"') % 2 == 0:
+                break
+
+        lines = []
+        quotes = 0
+        for line in f:
+            lines.append(line)
+            quotes += line.count('"')
+            if len(lines) >= chunk_size and quotes % 2 == 0:
+                yield header, "".join(lines)
+                lines = []
+                quotes = 0
+        if lines:
+            yield header, "".join(lines)
+
+
+_mappies = {}
+
+
+def parse_block(index_name, csv_file, header, block):
+    """Parse one raw CSV block and apply the index's column transforms (runs in a worker process)"""
+    if index_name not in _mappies:
+        _mappies[index_name] = MappingFactory.getMappy(index_name, csv_file)
+    df = pd.read_csv(io.StringIO(header + block))
+    return prepare_chunk(df, _mappies[index_name])
+
+
+def parse_blocks_in_pool(csv_file, index_name, chunk_size, processes, max_pending=None, skip=0):
+    """
+    Parse CSV blocks in a process pool and yield (block number, documents) in file order.
+
+    At most max_pending blocks are in flight, so memory stays bounded even
+    when indexing is slower than parsing. The first skip blocks are not parsed.
+    """
+    max_pending = max_pending or processes * 2
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = deque()
+        for block_no, (header, block) in enumerate(read_csv_blocks(csv_file, chunk_size)):
+            if block_no < skip:
+                continue
+            pending.append((block_no, pool.submit(parse_block, index_name, csv_file, header, block)))
+            if len(pending) >= max_pending:
+                block_no, future = pending.popleft()
+                yield block_no, future.result()
+        while pending:
+            block_no, future = pending.popleft()
+            yield block_no, future.result()
+
+
+def load_manifest(path):
+    """
+    Load the row manifest of the previous upload.
+
+    Returns:
+        Series of 64 bit row content hashes indexed by document id, empty on the first run
+    """
+    if not os.path.exists(path):
+        return pd.Series([], index=pd.Index([], dtype=object), dtype="uint64")
+    manifest = pd.read_parquet(path)
+    return pd.Series(manifest["hash"].to_numpy(), index=pd.Index(manifest["id"]), dtype="uint64")
+
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    pd.DataFrame({"id": manifest.index, "hash": manifest.to_numpy()}).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def diff_chunk(df, mappy, previous):
+    """
+    Compare one raw CSV chunk against the previous manifest.
+
+    Returns:
+        Tuple of (changed, manifest) where changed is a boolean mask of rows that
+        are new or whose content changed, and manifest is the chunk's id -> hash Series
+    """
+    ids = document_ids(df, mappy.idColumn)
+    hashes = row_hashes(_stable_strings(df))
+    manifest = pd.Series(hashes, index=pd.Index(ids, dtype=object), dtype="uint64")
+
+    positions = previous.index.get_indexer(manifest.index)
+    known = positions >= 0
+    changed = ~known
+    changed[known] = previous.to_numpy()[positions[known]] != hashes[known]
+    return changed, manifest
+
+
+class Checkpoint:
+    """
+    Record the last CSV chunk Elasticsearch acknowledged so a crashed upload can resume.
+
+    The checkpoint is only honoured when the CSV file, chunk size and upload
+    mode are unchanged, since chunk numbers mean something different otherwise.
+    """
+
+    def __init__(self, path, csv_file, chunk_size, upload_mode):
+        self.path = path
+        stat = os.stat(csv_file)
+        self.source = {
+            "csv_file": os.path.abspath(csv_file),
+            "csv_size": stat.st_size,
+            "csv_mtime": stat.st_mtime,
+            "chunk_size": chunk_size,
+            "upload_mode": upload_mode,
+        }
+        # [chunk number, documents still waiting for a response] in send order
+        self.pending = deque()
+        # Once a document failed the checkpoint stays before its chunk, so a resume sends it again
+        self.failed = False
+
+    def resume_from(self):
+        """Number of the first chunk that still has to be sent"""
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "r") as f:
+            saved = json.load(f)
+        if saved.get("source") != self.source:
+            print(f"Ignoring checkpoint {self.path}, the CSV or upload settings changed")
+            return 0
+        print(f"Resuming after chunk {saved['last_chunk']} from checkpoint {self.path}")
+        return saved["last_chunk"] + 1
+
+    def add_chunk(self, chunk_no, doc_count):
+        if doc_count:
+            self.pending.append([chunk_no, doc_count])
+
+    def acknowledge(self, ok=True):
+        """Count one bulk response, saving the checkpoint when a whole chunk is done"""
+        if not ok:
+            self.failed = True
+        self.pending[0][1] -= 1
+        if self.pending[0][1] == 0:
+            chunk_no, _ = self.pending.popleft()
+            if not self.failed:
+                self.save(chunk_no)
+
+    def save(self, chunk_no):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"source": self.source, "last_chunk": chunk_no}, f)
+        os.replace(tmp_path, self.path)
+
+    def complete(self):
+        """Remove the checkpoint once the whole CSV is indexed, it is kept when documents failed"""
+        if self.failed:
+            print(f"Some documents failed, checkpoint {self.path} was kept to resume from the first failed chunk")
+            return
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ProgressReporter:
+    """Print indexed document counts and throughput while an upload runs"""
+
+    def __init__(self, index_name, interval=5.0):
+        self.index_name = index_name
+        self.interval = interval
+        self.indexed = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def update(self, ok, count=1):
+        if ok:
+            self.indexed += count
+        else:
+            self.failed += count
+
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.indexed / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        print(
+            f"[{self.index_name}] {self.indexed} indexed, {self.failed} failed, "
+            f"{elapsed:.1f}s elapsed, {self.rate():.0f} docs/sec"
+        )
+
+    def finish(self):
+        self.report()
+        print(f"Uploaded {self.indexed} documents to index {self.index_name}")
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import pandas as pd
+
+
+def _jsonable(value):
+    if isinstance(value, pd.DataFrame):
+        return value.to_dict("split")
+    # Elasticsearch responses wrap the parsed JSON, default=str would hash their repr
+    value = getattr(value, "body", value)
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+def schema_hash(schema):
+    """Hash of an index mapping or a dict of table schema DataFrames"""
+    text = json.dumps(_jsonable(schema), sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def normalize_request(request):
+    return re.sub(r"\s+", " ", request).strip().casefold()
+
+
+class LLMCache:
+    """
+    On-disk cache of parsed LLM query suggestions, stored in a sqlite file.
+
+    Entries are keyed on the bot, the model, the normalized request and a hash
+    of the schema, so a schema change misses the cache automatically. Entries
+    expire after ttl seconds and the least recently used ones are dropped
+    beyond max_entries.
+    """
+
+    def __init__(self, path, ttl=86400, max_entries=1000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)"
+            )
+
+    def _connect(self):
+        # A short-lived connection per call, Streamlit runs every rerun on a different thread
+        return sqlite3.connect(self.path, timeout=5)
+
+    def key(self, namespace, model, request, schema):
+        parts = [namespace, model, normalize_request(request), schema_hash(schema)]
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def get(self, namespace, model, request, schema):
+        """Cached list of (query_name, query_body) tuples, or None"""
+        key = self.key(namespace, model, request, schema)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND created > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return [tuple(query) for query in json.loads(row[0])]
+
+    def put(self, namespace, model, request, schema, queries):
+        if not queries:
+            return
+        key = self.key(namespace, model, request, schema)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, json.dumps(queries), now, now),
+            )
+            conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY accessed DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+
+def get_llm_cache(config):
+    """Cache stored in the project directory, sized from the .env settings"""
+    return LLMCache(
+        os.path.join(config["path"], ".llm_cache.sqlite"),
+        ttl=int(config.get("llm_cache_ttl", 86400)),
+        max_entries=int(config.get("llm_cache_max_entries", 1000)),
+    )
@@ -0,0 +1,428 @@
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as Urllib3Error, ReadTimeoutError
+
+
+class QueryStreamParser:
+    """
+    Pull complete {"query_name", "query_body"} JSON objects out of text that arrives in pieces.
+
+    Top-level objects are found by matching braces outside of JSON strings, so
+    an object is returned as soon as its closing brace arrives, whether the
+    model puts one per line, pretty-prints them or wraps them in a list or a
+    markdown fence.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.start = None
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, text):
+        """Add text and return the list of query objects completed by it"""
+        self.buffer += text
+        found = []
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.depth > 0:
+                self.in_string = True
+            elif char == "{":
+                if self.depth == 0:
+                    self.start = self.pos
+                self.depth += 1
+            elif char == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    query = self._parse(self.buffer[self.start:self.pos + 1])
+                    if query:
+                        found.append(query)
+            self.pos += 1
+
+        # Drop text that can no longer be part of an object
+        if self.depth == 0:
+            self.buffer = ""
+            self.pos = 0
+        elif self.start:
+            self.buffer = self.buffer[self.start:]
+            self.pos -= self.start
+            self.start = 0
+        return found
+
+    def _parse(self, text):
+        try:
+            query = json.loads(text)
+        except ValueError:
+            return None
+        if isinstance(query, dict) and "query_name" in query and "query_body" in query:
+            return query
+        return None
+
+
+def parse_queries(text):
+    """All complete query objects in a full response text"""
+    return QueryStreamParser().feed(text)
+
+
+class LLMBackend:
+    """
+    What the bots need from a chat completion backend.
+
+    Subclasses implement complete() and, when they can, stream(). Sending a
+    batch in parallel and pulling queries out of a stream are shared.
+    """
+
+    max_concurrency = 1
+
+    def complete(self, payload):
+        """Message content of a blocking chat completion, or None when it failed"""
+        raise NotImplementedError
+
+    def stream(self, payload):
+        """Yield the content of a chat completion in pieces, by default all at once"""
+        content = self.complete(payload)
+        if content:
+            yield content
+
+    def complete_many(self, payloads):
+        """
+        Send several payloads at once, for example one prompt to several models.
+
+        Returns:
+            Message contents in the order of payloads, None for the ones that failed
+        """
+        def complete(payload):
+            try:
+                return self.complete(payload)
+            except (requests.RequestException, ValueError, KeyError, IndexError, TypeError) as e:
+                # Backends other than LLMClient may not turn a malformed answer into None themselves
+                print("Failed to fetch data from API:", repr(e))
+                return None
+
+        if len(payloads) <= 1:
+            return [complete(payload) for payload in payloads]
+        with ThreadPoolExecutor(max_workers=min(len(payloads), self.max_concurrency)) as executor:
+            return list(executor.map(complete, payloads))
+
+    def stream_queries(self, payload):
+        """Yield each query object of a streamed completion as soon as it is complete"""
+        parser = QueryStreamParser()
+        for content in self.stream(payload):
+            for query in parser.feed(content):
+                yield query
+
+
+def _sse_lines(response):
+    """
+    Lines of a streamed response as soon as they arrive.
+
+    iter_lines reads fixed size blocks and waits for a block to fill, which
+    holds back short events and the final [DONE] of a body that is not sent
+    chunked. Errors are raised as the requests exceptions iter_lines raises.
+    """
+    pending = b""
+    while True:
+        try:
+            data = response.raw.read1(8192, decode_content=True)
+        except ReadTimeoutError as e:
+            raise requests.ConnectionError(e, response=response)
+        except Urllib3Error as e:
+            raise requests.exceptions.ChunkedEncodingError(e, response=response)
+        if not data:
+            break
+        *lines, pending = (pending + data).split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r").decode("utf-8", errors="replace")
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+
+# Rate limits and transient server errors are worth another attempt
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMClient(LLMBackend):
+    """
+    Chat completion client shared by every rerun and session of this process.
+
+    Requests go through one pooled requests.Session so connections are kept
+    alive, at most max_concurrency requests are in flight at once, and 429/5xx
+    answers or connection failures are retried with exponential backoff and
+    full jitter (honouring Retry-After).
+    """
+
+    def __init__(self, url, headers, timeout=(5, 60), max_concurrency=4, max_retries=3, backoff=0.5, max_backoff=30):
+        self.url = url
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _delay(self, attempt, response=None):
+        if response is not None and response.headers.get("Retry-After"):
+            try:
+                return min(float(response.headers["Retry-After"]), self.max_backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _post(self, payload, stream=False):
+        """
+        POST with retries, the caller must close the response.
+
+        Returns:
+            The 200 response, or None when the API kept failing or answered with another status
+        """
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last:
+                    raise
+                print(f"LLM request failed ({e}), retrying")
+                time.sleep(self._delay(attempt))
+                continue
+            if response.status_code == 200:
+                return response
+            response.close()
+            if response.status_code not in RETRY_STATUSES or last:
+                print("Failed to fetch data from API. Status Code:", response.status_code)
+                return None
+            print(f"LLM request got status {response.status_code}, retrying")
+            time.sleep(self._delay(attempt, response))
+        return None
+
+    def complete(self, payload):
+        """Message content of a blocking chat completion, or None when it failed"""
+        with self.slots:
+            response = self._post(payload)
+            if response is None:
+                return None
+            with response:
+                try:
+                    content = response.json()["choices"][0]["message"]["content"]
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    # A 200 carrying an error page or a provider error object instead of a completion
+                    print(f"Unexpected API response ({e!r}):", response.text[:500])
+                    return None
+        print("API Response:", content)
+        return content
+
+    def stream(self, payload):
+        """
+        Yield the content deltas of a server-sent-events chat completion as they arrive.
+
+        Only the initial request is retried, a stream that breaks half way raises.
+        The read timeout applies to every chunk, so a stalled stream fails instead
+        of hanging the app.
+        """
+        with self.slots:
+            response = self._post(dict(payload, stream=True), stream=True)
+            if response is None:
+                return
+            with response:
+                for line in _sse_lines(response):
+                    # Blank lines separate events, lines starting with ":" are keep-alive comments
+                    if not line or line.startswith(":") or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        event = json.loads(data)
+                        content = (event.get("choices") or [{}])[0].get("delta", {}).get("content")
+                    except (ValueError, AttributeError, IndexError, KeyError, TypeError):
+                        # Not a completion chunk, for example a provider error object
+                        print("Unexpected stream event:", data[:500])
+                        continue
+                    if isinstance(content, str) and content:
+                        yield content
+
+
+ES_TERMS_TYPES = {"keyword", "constant_keyword", "boolean", "ip"}
+ES_NUMERIC_TYPES = {"long", "integer", "short", "byte", "double", "float", "half_float", "scaled_float", "unsigned_long"}
+ES_DATE_TYPES = {"date", "date_nanos"}
+
+
+def _summary_fields(text):
+    # '"name" type, ...' as written by schemaSummary.describe
+    return re.findall(r'"((?:[^"]|"")*)" ([^,;\n]+)', text)
+
+
+def template_es_queries(prompt):
+    """Queries built from the fields of an index summary, most relevant fields first"""
+    fields = [(name.replace('""', '"'), field_type.strip()) for name, field_type in _summary_fields(prompt)]
+    queries = [{"query_name": "Sample documents", "query_body": {"size": 10, "query": {"match_all": {}}}}]
+    terms = next((name for name, field_type in fields if field_type in ES_TERMS_TYPES), None)
+    numeric = next((name for name, field_type in fields if field_type in ES_NUMERIC_TYPES), None)
+    date = next((name for name, field_type in fields if field_type in ES_DATE_TYPES), None)
+    if terms:
+        queries.append({
+            "query_name": f"Top {terms} values",
+            "query_body": {"size": 0, "aggs": {"top_values": {"terms": {"field": terms, "size": 10}}}},
+        })
+    if numeric:
+        queries.append({
+            "query_name": f"{numeric} statistics",
+            "query_body": {"size": 0, "aggs": {"statistics": {"stats": {"field": numeric}}}},
+        })
+    elif date:
+        queries.append({
+            "query_name": f"Documents per month of {date}",
+            "query_body": {"size": 0, "aggs": {"per_month": {"date_histogram": {"field": date, "calendar_interval": "month"}}}},
+        })
+    return queries
+
+
+def template_sql_queries(prompt):
+    """Queries built from the most relevant table and columns of a table summary"""
+    for line in prompt.splitlines():
+        match = re.match(r"\s*(.+?): (.*)$", line)
+        if not match:
+            continue
+        columns = _summary_fields(match.group(2))
+        if not columns:
+            continue
+        table = '"' + match.group(1).replace('"', '""') + '"'
+        numeric = next((name for name, column_type in columns if re.search(r"int|real|double|float|numeric|decimal", column_type, re.I)), None)
+        text = next((name for name, column_type in columns if name != numeric), None)
+        queries = [{"query_name": f"Sample of {match.group(1)}", "query_body": f"SELECT * FROM {table} LIMIT 10;"}]
+        if text:
+            queries.append({
+                "query_name": f"Most common {text}",
+                "query_body": f'SELECT "{text}", COUNT(*) AS count FROM {table} GROUP BY "{text}" ORDER BY count DESC LIMIT 10;',
+            })
+        if numeric:
+            queries.append({
+                "query_name": f"{numeric} statistics",
+                "query_body": f'SELECT MIN("{numeric}") AS min, AVG("{numeric}") AS average, MAX("{numeric}") AS max FROM {table};',
+            })
+        return queries
+    return []
+
+
+class StubBackend(LLMBackend):
+    """
+    Local stand-in for the API, for offline runs and repeatable benchmarks.
+
+    Answers are canned queries when given, otherwise queries built from the
+    schema summary in the prompt. The answer is one JSON object per line,
+    sent in chunk_size pieces after latency seconds and chunk_latency seconds
+    between pieces, so timings only depend on the settings.
+    """
+
+    def __init__(self, latency=0.5, chunk_latency=0.01, chunk_size=20, responses=None, max_concurrency=4):
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.chunk_size = chunk_size
+        self.responses = responses
+        self.max_concurrency = max_concurrency
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+
+    def response(self, payload):
+        if self.responses is not None:
+            queries = self.responses
+        else:
+            prompt = "\n".join(message["content"] for message in payload["messages"])
+            queries = template_es_queries(prompt) if "Elasticsearch" in prompt else template_sql_queries(prompt)
+        return "\n".join(json.dumps(query) for query in queries)
+
+    def _chunks(self, text):
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+
+    def complete(self, payload):
+        with self.slots:
+            content = self.response(payload)
+            time.sleep(self.latency + self.chunk_latency * len(self._chunks(content)))
+        return content
+
+    def stream(self, payload):
+        with self.slots:
+            time.sleep(self.latency)
+            for chunk in self._chunks(self.response(payload)):
+                time.sleep(self.chunk_latency)
+                yield chunk
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(config):
+    """
+    Backend chosen by llm_backend in .env, shared by every rerun and session of this process.
+
+    "api" (the default) calls API_URL, "stub" answers locally without network.
+    Imported modules survive reruns, so a module level instance lives as long as the server.
+    """
+    backend = config.get("llm_backend", "api")
+    max_concurrency = int(config.get("llm_max_concurrency", 4))
+    if backend == "stub":
+        settings = (
+            backend,
+            float(config.get("llm_stub_latency", 0.5)),
+            float(config.get("llm_stub_chunk_latency", 0.01)),
+            config.get("llm_stub_responses"),
+            max_concurrency,
+        )
+    elif backend == "api":
+        settings = (
+            backend,
+            config["API_URL"],
+            config["API_KEY"],
+            float(config.get("llm_connect_timeout", 5)),
+            float(config.get("llm_read_timeout", 60)),
+            max_concurrency,
+            int(config.get("llm_max_retries", 3)),
+            float(config.get("llm_backoff", 0.5)),
+        )
+    else:
+        raise ValueError(f"Unknown llm_backend {backend}, use api or stub")
+
+    with _clients_lock:
+        if settings not in _clients:
+            _clients[settings] = _create_backend(settings)
+        return _clients[settings]
+
+
+def _create_backend(settings):
+    if settings[0] == "stub":
+        _, latency, chunk_latency, responses_file, max_concurrency = settings
+        responses = None
+        if responses_file:
+            with open(responses_file, "r") as f:
+                responses = json.load(f)
+        return StubBackend(latency, chunk_latency, responses=responses, max_concurrency=max_concurrency)
+
+    _, url, api_key, connect_timeout, read_timeout, max_concurrency, max_retries, backoff = settings
+    return LLMClient(
+        url,
+        {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        timeout=(connect_timeout, read_timeout),
+        max_concurrency=max_concurrency,
+        max_retries=max_retries,
+        backoff=backoff,
+    )
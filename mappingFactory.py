@@ -1,24 +1,129 @@
+import ast
+import glob
+import importlib.util
+import json
+import os
+import sys
+from importlib.metadata import entry_points
 from mappy import Mappy
-from projects.australia.createMappings import AutraliaMapper
-from projects.carsapi.createMappings import CarsApiMappy
-from projects.test.createMappings import TestMappy
+from mappingInference import InferredMappy
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "projects")
+MAPPER_FILE = "createMappings.py"
+# Installed packages can also provide mappers: name = index name, value = "module:Class"
+ENTRY_POINT_GROUP = "dashbot.mappers"
+
+
+def _scan_mapper_file(path):
+    """Find classes assigning a string name at class level, without importing the file"""
+    with open(path, "r") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    found = {}
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef) or not node.bases:
+            continue
+        for statement in node.body:
+            if (
+                isinstance(statement, ast.Assign)
+                and any(isinstance(target, ast.Name) and target.id == "name" for target in statement.targets)
+                and isinstance(statement.value, ast.Constant)
+                and isinstance(statement.value.value, str)
+            ):
+                found[statement.value.value] = node.name
+    return found
+
+
+class MapperRegistry:
+    """
+    Index of index name -> mapper class location, built by scanning projects/*/createMappings.py.
+
+    Files are parsed, not imported, and the result is cached in projects/.mappers.json
+    keyed on file modification times, so only the requested mapper module is ever imported.
+    """
+
+    def __init__(self, projects_dir=PROJECTS_DIR):
+        self.projects_dir = projects_dir
+        self.cache_path = os.path.join(projects_dir, ".mappers.json")
+        self.loaded = {}
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def index(self):
+        """Return {index name: {"path", "class"}}, rescanning only files that changed"""
+        cached = self._load_cache()
+        files = {}
+        changed = False
+        for path in sorted(glob.glob(os.path.join(self.projects_dir, "*", MAPPER_FILE))):
+            mtime = os.path.getmtime(path)
+            entry = cached.get(path)
+            if entry is None or entry["mtime"] != mtime:
+                entry = {"mtime": mtime, "mappers": _scan_mapper_file(path)}
+                changed = True
+            files[path] = entry
+        if changed or files.keys() != cached.keys():
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(files, f, indent=2)
+            os.replace(tmp_path, self.cache_path)
+
+        mappers = {}
+        for path, entry in files.items():
+            for name, class_name in entry["mappers"].items():
+                mappers[name] = {"path": path, "class": class_name}
+        return mappers
+
+    def _import(self, path, class_name):
+        project = os.path.basename(os.path.dirname(path))
+        module_name = f"projects.{project}.{MAPPER_FILE[:-3]}"
+        module = sys.modules.get(module_name)
+        if module is None:
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+        return getattr(module, class_name)
+
+    def get(self, index_name):
+        """Mapper class registered for index_name, or None"""
+        if index_name in self.loaded:
+            return self.loaded[index_name]
+
+        mapper = None
+        location = self.index().get(index_name)
+        if location:
+            mapper = self._import(location["path"], location["class"])
+        else:
+            for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+                if entry_point.name == index_name:
+                    mapper = entry_point.load()
+                    break
+
+        if mapper is not None and not issubclass(mapper, Mappy):
+            raise TypeError(f"Mapper {mapper.__name__} for index {index_name} is not a Mappy subclass")
+        self.loaded[index_name] = mapper
+        return mapper
+
+
+registry = MapperRegistry()
+
 
 class MappingFactory:
     @staticmethod
-    def getMappy(index_name):
-        if index_name == AutraliaMapper.name:
-            return AutraliaMapper()
-        
-        elif index_name == CarsApiMappy.name:
-            return CarsApiMappy()
-        
-        elif index_name == TestMappy.name:
-            return TestMappy()
+    def getMappy(index_name, csv_file=None):
+        mapper = registry.get(index_name)
+        if mapper is not None:
+            return mapper()
+        elif csv_file:
+            # No project mapper, infer the mapping from the csv instead of relying on dynamic mapping
+            return InferredMappy(index_name, csv_file)
         else:
             return Mappy()
-        
-        
-        
-        
-
-    
\ No newline at end of file
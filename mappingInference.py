@@ -0,0 +1,168 @@
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+from mappy import Mappy, GeoPoint, ParseDate
+
+
+INTEGER = re.compile(r"^[+-]?\d+$")
+FLOAT = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+BOOLEANS = {"true", "false"}
+
+# (pandas format, Elasticsearch format) pairs tried in order on string columns
+DATE_FORMATS = [
+    ("%Y-%m-%d", "yyyy-MM-dd"),
+    ("%Y-%m-%d %H:%M:%S", "yyyy-MM-dd HH:mm:ss"),
+    ("%Y-%m-%d %H:%M", "yyyy-MM-dd HH:mm"),
+    ("%Y-%m-%dT%H:%M:%S", "strict_date_optional_time"),
+    # Also matches a space separator and fractions Elasticsearch rejects, these columns are rewritten as ISO
+    ("ISO8601", "strict_date_optional_time"),
+    ("%m/%d/%Y", "MM/dd/yyyy"),
+    ("%d/%m/%Y", "dd/MM/yyyy"),
+]
+
+# Epoch numbers between 2001 and 2286
+EPOCH_MILLIS_RANGE = (10**12, 10**13)
+EPOCH_SECONDS_RANGE = (10**9, 10**10)
+TIME_NAME_HINTS = ("epoch", "time", "timestamp", "_at", "date")
+
+LAT_NAMES = {"lat", "latitude"}
+LON_NAMES = {"lon", "lng", "long", "longitude"}
+
+KEYWORD_MAX_UNIQUE = 1000
+KEYWORD_MAX_LENGTH = 256
+
+
+def _all_between(numbers, low, high):
+    return bool(((numbers >= low) & (numbers < high)).all())
+
+
+def infer_field(name, values):
+    """
+    Pick the tightest Elasticsearch field type for one column.
+
+    Args:
+        name: Column name, used for id and timestamp hints
+        values: Series of the column's non-null sample values as strings
+
+    Returns:
+        Field mapping dictionary, or None when the sample has no values
+    """
+    if values.empty:
+        return None
+    text = values.str.strip()
+    lowered_name = name.lower()
+
+    if text.str.lower().isin(BOOLEANS).all():
+        return {"type": "boolean"}
+
+    if text.str.match(INTEGER).all():
+        numbers = pd.to_numeric(text, errors="coerce")
+        if numbers.isna().any():
+            # Too large for int64
+            return {"type": "keyword"}
+        if lowered_name == "id" or lowered_name.endswith("_id"):
+            return {"type": "keyword"}
+        if _all_between(numbers, *EPOCH_MILLIS_RANGE):
+            return {"type": "date", "format": "epoch_millis"}
+        if _all_between(numbers, *EPOCH_SECONDS_RANGE) and any(hint in lowered_name for hint in TIME_NAME_HINTS):
+            return {"type": "date", "format": "epoch_second"}
+        if _all_between(numbers, np.iinfo(np.int32).min, np.iinfo(np.int32).max):
+            return {"type": "integer"}
+        return {"type": "long"}
+
+    if text.str.match(FLOAT).all():
+        return {"type": "double"}
+
+    for pandas_format, es_format in DATE_FORMATS:
+        # utc=True, so a column mixing offsets like Z and +02:00 parses instead of warning
+        parsed = pd.to_datetime(text, format=pandas_format, errors="coerce", utc=True)
+        if parsed.notna().all():
+            return {"type": "date", "format": es_format}
+
+    if text.nunique() <= min(KEYWORD_MAX_UNIQUE, len(text) // 2 + 1) and text.str.len().max() <= KEYWORD_MAX_LENGTH:
+        return {"type": "keyword"}
+    if text.str.len().max() <= KEYWORD_MAX_LENGTH:
+        return {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": KEYWORD_MAX_LENGTH}}}
+    return {"type": "text"}
+
+
+def find_geo_points(sample, properties):
+    """Pair up numeric latitude and longitude columns, returning [geo field, lat, lon] lists"""
+    lats = [col for col in sample.columns if col.lower() in LAT_NAMES]
+    lons = [col for col in sample.columns if col.lower() in LON_NAMES]
+    pairs = []
+    for lat, lon in zip(lats, lons):
+        if properties.get(lat, {}).get("type") not in ("double", "integer", "long"):
+            continue
+        if properties.get(lon, {}).get("type") not in ("double", "integer", "long"):
+            continue
+        lat_values = pd.to_numeric(sample[lat], errors="coerce").dropna()
+        lon_values = pd.to_numeric(sample[lon], errors="coerce").dropna()
+        if lat_values.abs().max() <= 90 and lon_values.abs().max() <= 180:
+            field = "location" if "location" not in sample.columns else f"{lat}_{lon}_location"
+            pairs.append([field, lat, lon])
+    return pairs
+
+
+def infer_mapping(csv_file, sample_rows=10000):
+    """
+    Infer an explicit mapping from the first sample_rows rows of the CSV.
+
+    Returns:
+        Tuple of (mapping body for indices.create, geo point [field, lat, lon] lists,
+        columns to rewrite as ISO 8601 dates)
+    """
+    sample = pd.read_csv(csv_file, nrows=sample_rows, dtype=str)
+    properties = {}
+    for col in sample.columns:
+        field = infer_field(col, sample[col].dropna())
+        if field:
+            properties[col] = field
+
+    geo_points = find_geo_points(sample, properties)
+    for field, _, _ in geo_points:
+        properties[field] = {"type": "geo_point"}
+
+    iso_dates = [col for col, field in properties.items() if field.get("format") == "strict_date_optional_time"]
+    return {"mappings": {"properties": properties}}, geo_points, iso_dates
+
+
+def load_or_infer_mapping(csv_file, index_name, sample_rows=10000):
+    """
+    Return the inferred mapping cached next to the CSV, inferring and caching it on the first run.
+
+    The cache is kept even when the CSV changes so the mapping stays consistent
+    with the existing index. Delete or edit <index>_mapping.json to change it.
+    """
+    cache_path = os.path.join(os.path.dirname(csv_file), index_name + "_mapping.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            cached = json.load(f)
+        # Caches written before iso_dates existed rewrite nothing, like before
+        return cached["mapping"], cached["geo_points"], cached.get("iso_dates", [])
+
+    print(f"Inferring mapping for index {index_name} from {csv_file}")
+    mapping, geo_points, iso_dates = infer_mapping(csv_file, sample_rows)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"mapping": mapping, "geo_points": geo_points, "iso_dates": iso_dates}, f, indent=2)
+    os.replace(tmp_path, cache_path)
+    print(f"Mapping cached in {cache_path}")
+    return mapping, geo_points, iso_dates
+
+
+class InferredMappy(Mappy):
+    """Mapper used for projects without a Mappy subclass, its mapping is inferred from the CSV"""
+
+    def __init__(self, index_name, csv_file):
+        self.name = index_name
+        self.mapping, geo_points, iso_dates = load_or_infer_mapping(csv_file, index_name)
+        self.transforms = [GeoPoint(field, lat=lat, lon=lon) for field, lat, lon in geo_points]
+        # strict_date_optional_time only takes a T separator, "2023-12-01 14:30:00.123" is rewritten.
+        # Values with Z or an offset are rewritten in UTC.
+        self.transforms += [ParseDate(column, format="ISO8601") for column in iso_dates]
+
+    def manualMappings(self):
+        return self.mapping
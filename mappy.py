@@ -1,8 +1,140 @@
+import numpy as np
+import pandas as pd
+
+
+def _with_none(series):
+    """Object series with None for missing values, so documents serialize cleanly"""
+    return series.astype(object).where(series.notna(), None)
+
+
+class GeoPoint:
+    """Build a geo_point column ([lon, lat] arrays) from latitude and longitude columns"""
+
+    def __init__(self, column, lat, lon):
+        self.column = column
+        self.lat = lat
+        self.lon = lon
+
+    def apply(self, df):
+        lat = pd.to_numeric(df[self.lat], errors="coerce").to_numpy(dtype=float)
+        lon = pd.to_numeric(df[self.lon], errors="coerce").to_numpy(dtype=float)
+        # [lon, lat] pairs built by ndarray.tolist() in C, no per-row Python call
+        points = pd.Series(np.column_stack([lon, lat]).tolist(), index=df.index, dtype=object)
+        df[self.column] = points.where(~(np.isnan(lat) | np.isnan(lon)), None)
+
+
+# A time ending in Z or an offset like +02:00
+ZONE_SUFFIX = r"\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?\s*(?:Z|[+-]\d{2}(?::?\d{2})?)$"
+
+
+class ParseDate:
+    """
+    Parse a date column with a fixed format and write it back as ISO 8601 strings.
+
+    Values that do not match the format become None. Pass unit (e.g. "ms") for
+    epoch numbers instead of a format. Fractions of a second are kept to the
+    millisecond. Values with a zone or offset are converted to UTC, which is
+    what Elasticsearch assumes for a date without one.
+    """
+
+    def __init__(self, column, format=None, unit=None):
+        self.column = column
+        self.format = format
+        self.unit = unit
+
+    def _parse(self, values):
+        """Naive UTC datetimes of text values"""
+        zoned = values.astype(str).str.contains(ZONE_SUFFIX)
+        if zoned.any() and not zoned.all():
+            # pandas' ISO8601 parser gives a naive value the offset of the zoned value before it
+            return pd.concat([self._parse(values[zoned]), self._parse(values[~zoned])]).sort_index()
+        # utc=True gives one dtype for naive, zoned and mixed offset values, naive ones are taken as UTC already
+        return pd.to_datetime(values, format=self.format, errors="coerce", utc=True).dt.tz_convert(None)
+
+    def apply(self, df):
+        if self.unit:
+            dates = pd.to_datetime(pd.to_numeric(df[self.column], errors="coerce"), unit=self.unit)
+        else:
+            # Parse each distinct value once, timestamps repeat a lot in large files
+            codes, uniques = pd.factorize(df[self.column])
+            parsed = self._parse(pd.Series(uniques))
+            # Missing values have code -1, which takes the NaT appended at the end
+            parsed = np.append(parsed.to_numpy(), np.datetime64("NaT", "ns"))
+            dates = pd.Series(parsed.take(codes), index=df.index)
+        # Casting to datetime64 renders "YYYY-MM-DDTHH:MM:SS" in C, unlike dt.strftime.
+        # Milliseconds, the precision of an Elasticsearch date, are kept when the chunk has any
+        values = dates.to_numpy()
+        fraction = values.astype("int64") % 1_000_000_000
+        unit = "datetime64[ms]" if (fraction[dates.notna().to_numpy()] != 0).any() else "datetime64[s]"
+        text = pd.Series(values.astype(unit).astype(str), index=df.index, dtype=object)
+        df[self.column] = _with_none(text.where(dates.notna()))
+
+
+class Cast:
+    """Cast a column to "int", "float", "bool" or "str", turning unparseable values into None"""
+
+    TRUE_VALUES = {"true", "t", "yes", "y", "1"}
+    FALSE_VALUES = {"false", "f", "no", "n", "0"}
+
+    def __init__(self, column, dtype):
+        self.column = column
+        self.dtype = dtype
+
+    def apply(self, df):
+        values = df[self.column]
+        if self.dtype == "int":
+            values = pd.to_numeric(values, errors="coerce").round().astype("Int64")
+        elif self.dtype == "float":
+            values = pd.to_numeric(values, errors="coerce")
+        elif self.dtype == "bool":
+            text = values.astype(str).str.strip().str.lower()
+            values = pd.Series(pd.NA, index=values.index, dtype="boolean")
+            values[text.isin(self.TRUE_VALUES)] = True
+            values[text.isin(self.FALSE_VALUES)] = False
+        elif self.dtype == "str":
+            values = values.astype(str).where(values.notna())
+        else:
+            raise ValueError(f"Unsupported cast type: {self.dtype}")
+        df[self.column] = _with_none(values)
+
+
+class Derived:
+    """Add a column computed from the whole chunk, func takes the DataFrame and returns a Series"""
+
+    def __init__(self, column, func):
+        self.column = column
+        self.func = func
+
+    def apply(self, df):
+        df[self.column] = _with_none(pd.Series(self.func(df), index=df.index))
+
+
 class Mappy:
+    
+    # Column holding a unique key per row, used as the document _id.
+    # When None the _id is a hash of the whole row.
+    idColumn = None
+    
+    # Column transforms run in order on every chunk, e.g. [GeoPoint("location", "lat", "lng")]
+    transforms = []
+    
     def manualMappings(self):
         return {}
     
     
     
     def additionalColumn(self,df):
-        return
\ No newline at end of file
+        for transform in self.transforms:
+            transform.apply(df)
+    
+    
+    def bulkLoadProfile(self):
+        """Index settings applied while bulk loading, restored once the upload finishes"""
+        return {
+            "settings": {
+                "refresh_interval": "-1",
+                "number_of_replicas": 0,
+            },
+            # Segment count to force-merge down to after the load, None to skip
+            "force_merge_segments": None,
+        }
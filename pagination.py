@@ -0,0 +1,240 @@
+import datetime
+import decimal
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from elasticsearch import NotFoundError
+from arrowResults import es_hits_table
+
+
+# Fetches pages for every pager of the process, the page after the one being viewed loads here in the background
+_fetcher = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pager")
+
+
+class Pager:
+    """
+    Fetches one page of a result at a time.
+
+    Subclasses implement _fetch(after), which returns the page starting after
+    the key after and the key the next page starts after (None on the last
+    page). Only the keys of visited pages are kept for good, the rows of pages
+    more than one away from the one being viewed are dropped.
+    """
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+        self.after = {0: None}
+        self.pages = {}
+        self.lock = threading.Lock()
+
+    def _fetch(self, after):
+        raise NotImplementedError
+
+    def _load(self, number):
+        with self.lock:
+            after = self.after[number]
+        rows, next_after = self._fetch(after)
+        if next_after is not None:
+            with self.lock:
+                self.after[number + 1] = next_after
+        return rows, next_after is not None
+
+    def _future(self, number):
+        with self.lock:
+            future = self.pages.get(number)
+            if future is None:
+                future = _fetcher.submit(self._load, number)
+                self.pages[number] = future
+        return future
+
+    def page(self, number):
+        """
+        Rows of page number and whether there is a page after it, the next page is prefetched.
+
+        Page number has to be 0 or follow a page that was loaded before.
+        """
+        future = self._future(number)
+        try:
+            rows, has_next = future.result()
+        except Exception:
+            with self.lock:
+                self.pages.pop(number, None)
+            raise
+        if has_next:
+            self._future(number + 1)
+        with self.lock:
+            for other in list(self.pages):
+                if abs(other - number) > 1:
+                    del self.pages[other]
+        return rows, has_next
+
+    def describe(self, number, rows):
+        first = number * self.page_size + 1
+        return f"Rows {first:,}-{first + rows - 1:,}" if rows else "No rows"
+
+    def close(self):
+        pass
+
+
+class EsPager(Pager):
+    """
+    Pages through the hits of a query with a point in time and search_after.
+
+    The point in time keeps every page consistent with the first one, sorted
+    by the query's sort (or index order) with the _shard_doc tiebreaker.
+    """
+
+    def __init__(self, es, index_name, query_body, page_size=100, keep_alive="5m"):
+        super().__init__(page_size)
+        self.es = es
+        self.index_name = index_name
+        self.keep_alive = keep_alive
+        self.body = {
+            key: value for key, value in query_body.items()
+            if key not in ("aggs", "aggregations", "size", "from", "search_after", "pit", "terminate_after")
+        }
+        self.body.setdefault("sort", ["_shard_doc"])
+        self.total = None
+        self._open()
+
+    def _open(self):
+        self.pit_id = self.es.open_point_in_time(index=self.index_name, keep_alive=self.keep_alive)["id"]
+
+    def _search(self, after):
+        with self.lock:
+            pit_id = self.pit_id
+        body = dict(self.body, size=self.page_size + 1, pit={"id": pit_id, "keep_alive": self.keep_alive})
+        if after is not None:
+            body["search_after"] = after
+        return self.es.search(body=body)
+
+    def _fetch(self, after):
+        try:
+            response = self._search(after)
+        except NotFoundError:
+            # The point in time expired while nobody was paging, continue on a new one
+            self._open()
+            response = self._search(after)
+        with self.lock:
+            self.pit_id = response.get("pit_id", self.pit_id)
+            total = response["hits"].get("total")
+            if total is not None and after is None:
+                self.total = total
+        hits = response["hits"]["hits"]
+        rows = es_hits_table(hits[:self.page_size])
+        next_after = hits[self.page_size - 1]["sort"] if len(hits) > self.page_size else None
+        return rows, next_after
+
+    def describe(self, number, rows):
+        text = super().describe(number, rows).replace("Rows", "Hits")
+        if isinstance(self.total, dict):
+            more = "more than " if self.total.get("relation") == "gte" else ""
+            text += f" of {more}{self.total['value']:,}"
+        return text
+
+    def close(self):
+        try:
+            self.es.close_point_in_time(id=self.pit_id)
+        except Exception:
+            # Already expired
+            pass
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sql_literal(value):
+    """value as a SQL literal, so page queries need no driver specific placeholders"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat(sep=" ")
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _source(query):
+    return query.rstrip().rstrip(";")
+
+
+def result_columns(query, read):
+    """Column names of query's result, from a LIMIT 0 run that reads no rows"""
+    return read(f"SELECT * FROM (\n{_source(query)}\n) AS page_source LIMIT 0").column_names
+
+
+class KeysetPager(Pager):
+    """
+    Pages through a SELECT by keyset: WHERE (keys) > (last keys) ORDER BY keys LIMIT page_size.
+
+    Unlike OFFSET every page costs the same however deep it is. key_columns
+    have to be unique together and not null, rows sharing a key with the
+    end of a page would be skipped.
+
+    Args:
+        read: Function running a SQL string and returning a pyarrow Table. It is
+            called from background threads, so it should take its own connection.
+    """
+
+    def __init__(self, read, query, key_columns, page_size=100):
+        super().__init__(page_size)
+        self.read = read
+        self.query = query
+        self.key_columns = list(key_columns)
+
+    def _fetch(self, after):
+        keys = ", ".join(_quote(column) for column in self.key_columns)
+        where = ""
+        if after is not None:
+            where = f"WHERE ({keys}) > ({', '.join(sql_literal(value) for value in after)})"
+        rows = self.read(
+            f"SELECT * FROM (\n{_source(self.query)}\n) AS page_source {where} "
+            f"ORDER BY {keys} LIMIT {self.page_size + 1}"
+        )
+        next_after = None
+        if len(rows) > self.page_size:
+            next_after = tuple(rows.column(column)[self.page_size - 1].as_py() for column in self.key_columns)
+            rows = rows[:self.page_size]
+        return rows, next_after
+
+
+def get_pager(session_state, key, fingerprint, create):
+    """
+    Pager kept in the session for key, replaced when the query behind it changes.
+
+    The page being viewed is stored in session_state[key].
+    """
+    entry = session_state.get(f"{key}_pager")
+    if entry is None or entry[0] != fingerprint:
+        if entry is not None:
+            entry[1].close()
+        entry = (fingerprint, create())
+        session_state[f"{key}_pager"] = entry
+        session_state[key] = 0
+    return entry[1]
+
+
+def show_pages(st, pager, key):
+    """Table of the page being viewed with buttons to the previous and next page"""
+    # Only pages after a loaded one can be fetched, the key of the page before is needed
+    number = min(st.session_state.get(key, 0), max(pager.after))
+    rows, has_next = pager.page(number)
+    st.dataframe(rows, use_container_width=True)
+    previous_col, label_col, next_col = st.columns([1, 4, 1])
+    with previous_col:
+        if st.button("⬅️", key=f"{key}_previous", help="Previous page", disabled=number == 0):
+            st.session_state[key] = number - 1
+            st.rerun()
+    with label_col:
+        st.caption(f"Page {number + 1}, {pager.describe(number, len(rows))}")
+    with next_col:
+        if st.button("➡️", key=f"{key}_next", help="Next page", disabled=not has_next):
+            st.session_state[key] = number + 1
+            st.rerun()
@@ -8,23 +8,57 @@ import requests
 import pandas as pd
 import psycopg2
 from psycopg2 import sql
-from sqlalchemy import create_engine
+from connections import get_engine
+from schemaIntrospection import get_postgres_schema
+from llmCache import get_llm_cache
+from llmClient import get_llm_client, parse_queries
+from schemaSummary import summarize_sql_schema
+from queryGuard import limits_for, postgres_statement_timeout, read_sql_limited, truncation_message
+from queryCost import cost_budget, estimate_postgres_query, is_select
+from arrowResults import read_postgres_arrow
+from pagination import KeysetPager, get_pager, result_columns, show_pages
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from sql_formatter.core import format_sql
 
 
 
 from dotenv import dotenv_values
+from resultCache import get_result_cache, get_generation, sql_fingerprint
 
 config = dotenv_values(".env")
 path = config["path"]
-API_KEY = config["API_KEY"]
-API_URL = config["API_URL"]
 db_name = config["database_name_postgres"]
 db_user = config["database_user"]
 db_password = config["database_password"]
 db_host = config["database_host"]
 db_port = config["database_port"]
-headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
+model = config.get("model", "deepseek/deepseek-chat:free")
+# Generated queries are kept on disk and reused for the same request, model and schema
+llm_cache = get_llm_cache(config)
+# Generated queries are streamed and shown as they arrive unless llm_streaming is false
+llm_streaming = config.get("llm_streaming", "true").lower() == "true"
+# Several comma separated models get the same request in parallel, their queries are listed together
+models = [name.strip() for name in config.get("models", model).split(",") if name.strip()]
+# Pooled, retrying client with a limit on requests in flight
+llm_client = get_llm_client(config)
+# The prompt gets a ranked schema summary trimmed to this many tokens instead of the raw schema
+schema_token_budget = int(config.get("schema_token_budget", 1500))
+schema_stats = config.get("schema_stats", "true").lower() == "true"
+schema_sample_size = int(config.get("schema_sample_size", 1000))
+# Generated queries are estimated before they run, "reject" blocks the ones over budget, "warn" only shows it
+cost_gate = config.get("cost_gate", "reject")
+budget = cost_budget(config)
+# Every query gets a LIMIT and a timeout, saved widgets can override them
+default_limits = limits_for(config)
+# Results can be paged through by keyset, page_size rows at a time
+page_size = int(config.get("page_size", 100))
+# Widget results are reused until their ttl (seconds) runs out or new data is uploaded
+default_ttl = int(config.get("cache_ttl", 300))
+result_cache = get_result_cache(int(config.get("cache_max_entries", 256)))
+# Connections kept by the engine pool, saved widgets run concurrently on them
+pool_size = int(config.get("pool_size", 5))
+max_overflow = int(config.get("max_overflow", 5))
+widget_workers = int(config.get("widget_workers", pool_size))
 
 
 # Title of the app
@@ -64,14 +98,80 @@ def save_widget(query_name, query_body):
     st.success(f"Widget '{query_name}' saved successfully!")
         
         
-def displayDashboard(st,conn):
+def run_query(query, conn, limits=None):
+    """
+    Run query with a LIMIT and statement_timeout.
+
+    Returns:
+        (result pyarrow Table, whether rows were cut off)
+    """
+    limits = limits or default_limits
+    # A savepoint, so a cancelled statement does not abort the page's transaction
+    with conn.begin_nested():
+        postgres_statement_timeout(conn, limits.timeout)
+        return read_sql_limited(query, conn, limits, read_postgres_arrow)
+
+
+def read_page(query):
+    """Run a page query on its own pooled connection, pages are prefetched from background threads"""
+    with engine.connect() as page_conn:
+        with page_conn.begin():
+            postgres_statement_timeout(page_conn, default_limits.timeout)
+            return read_postgres_arrow(query, page_conn)
+
+
+def show_row_pages(query, key):
+    """Page through every row of query by keyset, only the page being viewed and the next one are fetched"""
+    try:
+        columns = result_columns(query, read_page)
+        key_columns = st.multiselect(
+            "Page by (columns that are unique together)", columns, default=columns[:1], key=f"{key}_keys"
+        )
+        if not key_columns:
+            st.info("Pick the columns to page by.")
+            return
+        pager = get_pager(
+            st.session_state,
+            key,
+            (db_file, sql_fingerprint(query), tuple(key_columns)),
+            lambda: KeysetPager(read_page, query, key_columns, page_size),
+        )
+        show_pages(st, pager, key)
+    except Exception as e:
+        st.error(f"Error paging through rows: {e}")
+
+
+def run_widget_query(widget, conn):
+    """Run a saved widget's SQL within its limits, reusing the cached (result, truncated) while it is fresh"""
+    limits = limits_for(config, widget)
+    key = (
+        "postgres",
+        db_file,
+        sql_fingerprint(widget["query"]),
+        limits.max_rows,
+        get_generation(path, "postgres", db_file),
+    )
+    result = result_cache.get(key)
+    if result is None:
+        result = run_query(widget["query"], conn, limits)
+        result_cache.put(key, result, widget.get("ttl", default_ttl))
+    return result
+
+
+def run_pooled_widget_query(widget):
+    """Run one widget on its own pooled connection (called from the worker threads)"""
+    with engine.connect() as conn:
+        return run_widget_query(widget, conn)
+
+
+def displayDashboard(st,engine):
     if st.session_state.saved_widgets:
         st.header("Saved Widgets")
         
         # Define number of columns in your grid
         num_cols = 2  # Adjust based on your preference
         grid_cols = st.columns(num_cols)
-
+        placeholders = []
         
         for i, widget in enumerate(st.session_state.saved_widgets):
             # Determine which column to place this widget in
@@ -104,16 +204,41 @@ def displayDashboard(st,conn):
                             json.dump(st.session_state.saved_widgets, f)
                         st.rerun()
                 
-                # Execute query and display results directly below the title row
-                result_df = pd.read_sql_query(widget["query"], conn)
-                st.dataframe(result_df, use_container_width=True)
+                # Results are filled in directly below the title row as each query finishes
+                placeholders.append(st.empty())
                 
                 st.markdown("---")
+
+        # Run the widget queries concurrently, a slow widget does not hold back the others
+        with ThreadPoolExecutor(max_workers=widget_workers) as pool:
+            futures = {
+                pool.submit(run_pooled_widget_query, widget): i
+                for i, widget in enumerate(st.session_state.saved_widgets)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    result_df, truncated = future.result()
+                    with placeholders[i].container():
+                        st.dataframe(result_df, use_container_width=True)
+                        if truncated:
+                            st.caption(truncation_message(limits_for(config, st.session_state.saved_widgets[i])))
+                except Exception as e:
+                    placeholders[i].error(f"Error executing query: {e}")
                 
                 
                 
-def get_chat_response(schemas, request):
-
+def chat_messages(schemas, request):
+    summary = summarize_sql_schema(
+        "postgres",
+        db_file,
+        schemas,
+        request,
+        connect=engine.connect if schema_stats else None,
+        budget=schema_token_budget,
+        generation=get_generation(path, "postgres", db_file),
+        sample_size=schema_sample_size,
+    )
     system_prompt = f"""
     You are a senior data analyst. Your client wants to understand more about their data. This is their request.
     Request:
@@ -123,11 +248,11 @@ def get_chat_response(schemas, request):
     Column names should be between quotation marks
 
     
-    Below is the Table schema you can use to query on:
-    {schemas}
+    Below are the tables and columns you can use to query on, with their type, distinct values and a range or examples:
+    {summary}
     """
     # print(system_prompt)
-    messages_with_context = [
+    return [
         {
             "role": "system",
             "content": "You are a data analyst specializing in SQL.",
@@ -135,67 +260,128 @@ def get_chat_response(schemas, request):
         {"role": "system", "content": system_prompt},
     ]
 
-    # Define the request payload (data)
+
+def parse_response(content):
+    ans = []
+    for query in parse_queries(content):
+        print(f"Query name: {query['query_name']}")
+        print(f"Query body: {query['query_body']}")
+        ans.append((query["query_name"], query["query_body"]))
+    return ans
+
+
+def get_chat_responses(schemas, prompts):
+    """
+    Answer several (model, request) prompts at once, the uncached ones are sent to the API in parallel.
+
+    Returns:
+        A list of (query_name, query_body) lists in the order of prompts
+    """
+    results = [llm_cache.get("postgres", name, request, schemas) for name, request in prompts]
+    missing = [i for i, cached in enumerate(results) if cached is None]
+    if len(missing) < len(prompts):
+        print("Using cached API response")
+
+    # Define the request payloads (data)
+    payloads = [
+        {"model": prompts[i][0], "messages": chat_messages(schemas, prompts[i][1])}
+        for i in missing
+    ]
+    for i, content in zip(missing, llm_client.complete_many(payloads)):
+        results[i] = parse_response(content) if content else []
+        llm_cache.put("postgres", prompts[i][0], prompts[i][1], schemas, results[i])
+    return results
+
+
+def get_chat_response(schemas, request):
+    return get_chat_responses(schemas, [(model, request)])[0]
+
+
+def stream_chat_response(schemas, request):
+    """Yield (query_name, query_body) tuples as soon as each one is complete in the streamed answer"""
+    cached = llm_cache.get("postgres", model, request, schemas)
+    if cached is not None:
+        print("Using cached API response")
+        yield from cached
+        return
+
     data = {
-        "model": "deepseek/deepseek-chat:free",
-        "messages": messages_with_context,
+        "model": model,
+        "messages": chat_messages(schemas, request),
     }
+    ans = []
+    for query in llm_client.stream_queries(data):
+        ans.append((query["query_name"], query["query_body"]))
+        yield ans[-1]
+    llm_cache.put("postgres", model, request, schemas, ans)
 
-    # Send the POST request to the DeepSeek API
-    response = requests.post(API_URL, json=data, headers=headers)
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        print("API Response:", response.json()["choices"][0]["message"]["content"])
-        response = response.json()["choices"][0]["message"]["content"]
+def generate_queries(schemas, request):
+    """
+    Ask the assistant for queries, showing each one as soon as it arrives.
 
-        json_objects = response.strip().split("\n")
-        
-        # Parse each line as a JSON object
-        queries = []
-
-        for obj in json_objects:
-            try:
-                response = json.loads(obj)
-                queries.append(response)
-            except:
-                pass
-        ans = []
-        # Now you can work with the parsed queries
-        for query in queries:
-            if "query_name" not in query or "query_body" not in query:
-                continue
-            print(f"Query name: {query['query_name']}")
-            print(f"Query body: {query['query_body']}")
-            ans.append((query["query_name"], query["query_body"]))
-        return ans
-    else:
-        print("Failed to fetch data from API. Status Code:", response.status_code)
-        return []
+    The preview is cleared at the end, the caller renders the editable version.
+    """
+    if len(models) > 1:
+        responses = get_chat_responses(schemas, [(name, request) for name in models])
+        return [
+            (f"{query_name} ({name})", query_body)
+            for name, queries in zip(models, responses)
+            for query_name, query_body in queries
+        ]
+    if not llm_streaming:
+        return get_chat_response(schemas, request)
 
-def getTablesAndSchemas(conn):
-    # Query to get all table names in the current database
-    query = """
-    SELECT table_name
-    FROM information_schema.tables
-    WHERE table_schema = 'public';
+    preview = st.empty()
+    container = preview.container()
+    queries = []
+    try:
+        for query_name, query_body in stream_chat_response(schemas, request):
+            queries.append((query_name, query_body))
+            container.markdown(f"**{query_name}**")
+            container.code(query_body, language="sql")
+    except requests.RequestException as e:
+        st.error(f"The query assistant did not answer: {str(e)}")
+    preview.empty()
+    return queries
+
+def estimate_query(query):
+    """Cost estimate of a query, cached like widget results"""
+    key = ("cost", db_file, sql_fingerprint(query), get_generation(path, "postgres", db_file))
+    estimate = result_cache.get(key)
+    if estimate is None:
+        # A separate connection, a failed EXPLAIN must not abort the page's transaction
+        with engine.connect() as explain_conn:
+            estimate = estimate_postgres_query(explain_conn, query, budget)
+        result_cache.put(key, estimate, default_ttl)
+    return estimate
+
+
+def gate_query(query):
     """
-    tables = pd.read_sql_query(query, conn)
-    # Dictionary to store table schemas
-    dic = dict()
-    
-    for selected_table in tables["table_name"]:
-        # Query to get column names and data types for each table
-        schema_query = f"""
-        SELECT column_name, data_type
-        FROM information_schema.columns
-        WHERE table_name = '{selected_table}';
-        """
-        schema_df = pd.read_sql_query(schema_query, conn)
-        # Simplified schema with only column name and data type
-        dic[selected_table] = schema_df[['column_name', 'data_type']]
-    
-    return dic
+    Show the cost estimate of a generated query before it can run.
+
+    Returns:
+        The query to run, with a LIMIT added when that brings it under budget,
+        or None when cost_gate is "reject" and it is still over budget
+    """
+    if cost_gate == "off":
+        return query
+    estimate = estimate_query(query)
+    st.caption(estimate.summary())
+    if estimate.rewrites:
+        st.caption("Rewritten to fit the budget: " + ", ".join(estimate.rewrites))
+    if estimate.over_budget:
+        if cost_gate == "reject":
+            st.error("Not run: " + "; ".join(estimate.reasons))
+            return None
+        st.warning("; ".join(estimate.reasons))
+    return estimate.query
+
+
+def getTablesAndSchemas(conn):
+    # One information_schema query, cached until the catalog changes
+    return get_postgres_schema(conn, db_file)
             
 def simpleSideBar(st,conn):
     with st.sidebar:
@@ -219,14 +405,17 @@ def simpleSideBar(st,conn):
         
 # Connect to the SQLite database
 try:
-    engine = create_engine(
-        f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_file}"
+    # Shared by every rerun and session, the pool stays warm between interactions
+    engine = get_engine(
+        f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_file}",
+        pool_size=pool_size,
+        max_overflow=max_overflow,
     )
     print("Connection to PostgreSQL established successfully.")
     st.success(f"Connected to database: {db_file}")
+    displayDashboard(st,engine)
     with engine.connect() as conn:
         with conn.begin():
-            displayDashboard(st,conn)
             # Sidebar for schema-related functionality
             simpleSideBar(st,conn)
             # Main content: SQL Query Executor
@@ -238,16 +427,20 @@ try:
             if st.button("Execute Query"):
                 try:
                     # Execute the query and fetch results
-                    result_df = pd.read_sql_query(user_query, conn)
+                    result_df, truncated = run_query(user_query, conn)
                     st.success("Query executed successfully!")
                     
                     # Display results in a neat format
                     st.write("Query Results:")
                     st.dataframe(result_df, use_container_width=True)
+                    if truncated:
+                        st.caption(truncation_message(default_limits))
                     is_valid_query = True
                 except Exception as e:
                     st.error(f"Error executing query: {e}")
                     is_valid_query = False
+            if is_select(user_query) and st.toggle("Page through all rows", key="own_pages_toggle"):
+                show_row_pages(user_query, "own_pages")
                     
             st.header("Save Query")
             query_name = st.text_input("Enter a name for this query:")
@@ -272,7 +465,7 @@ try:
             if st.button("Generate Custom Queries"):
                 if user_input:
                     with st.spinner("Generating queries based on your request..."):
-                        custom_queries = get_chat_response(getTablesAndSchemas(conn), user_input)
+                        custom_queries = generate_queries(getTablesAndSchemas(conn), user_input)
                         st.session_state.custom_queries = custom_queries
                 else:
                     st.warning("Please enter a description of what you're looking for.")
@@ -293,16 +486,25 @@ try:
 
                         try:
                             # Parse the edited query
+                            runnable = gate_query(edited_query)
 
                             # Execute query button
-                            if st.button(f"Run Query", key=f"custom_run_{i}"):
+                            if st.button(f"Run Query", key=f"custom_run_{i}", disabled=runnable is None):
                                 with st.spinner("Executing query..."):
-                                    result_df = pd.read_sql_query(edited_query, conn)
+                                    result_df, truncated = run_query(runnable, conn)
                                     st.dataframe(result_df, use_container_width=True)
+                                    if truncated:
+                                        st.caption(truncation_message(default_limits))
+
+                            if runnable is not None and is_select(runnable) and st.toggle("Page through all rows", key=f"custom_pages_toggle_{i}"):
+                                show_row_pages(runnable, f"custom_pages_{i}")
 
                             # Save widget button
                             if st.button(f"Save Widget", key=f"custom_save_{i}"):
-                                save_widget(query_name, edited_query)
+                                if runnable is None:
+                                    st.error("Cannot save. The query is over the cost budget")
+                                else:
+                                    save_widget(query_name, runnable)
 
                         except json.JSONDecodeError:
                             st.error("Invalid JSON query. Please fix the syntax.")
@@ -314,6 +516,4 @@ except Exception as e:
 
 finally:
     if 'conn' in locals():
-        conn.close()
-        
-engine.dispose()
\ No newline at end of file
+        conn.close()
\ No newline at end of file
@@ -1,10 +1,12 @@
-from mappy import Mappy
+from mappy import Mappy, GeoPoint
 
 
 class AutraliaMapper(Mappy):
     
     name = "australia"
     
+    transforms = [GeoPoint("location", lat="lat", lon="lng")]
+    
     def manualMappings(self):
         """Infer Elasticsearch mapping from pandas DataFrame"""
         return {
@@ -17,7 +19,4 @@ class AutraliaMapper(Mappy):
                     }
                 }
             }
-        
-        
-    def additionalColumn(self,df):
-        df["location"] = df.apply(lambda row: {"lat": float(row["lat"]), "lon": float(row["lng"])}, axis=1)
+
@@ -1,12 +1,16 @@
-from mappy import Mappy
-import pandas as pd
-from datetime import datetime
+from mappy import Mappy, ParseDate
 
 
 class CarsApiMappy(Mappy):
     
     name = "carsapi"
     
+    # Dates look like "M/d/yy, h:mm a" in the csv, they are sent in ISO format
+    transforms = [
+        ParseDate("Trim Created", format="%m/%d/%y, %I:%M %p"),
+        ParseDate("Trim Modified", format="%m/%d/%y, %I:%M %p"),
+    ]
+    
     def manualMappings(self):
         """Infer Elasticsearch mapping from pandas DataFrame"""
         return {
@@ -23,17 +27,4 @@ class CarsApiMappy(Mappy):
                     }
                 }
             }
-        
-        
-    def additionalColumn(self,df):
-        
-        def convert_date_time(date_time_str):
-            try:
-                # Parse the date-time in format "M/d/yy, h:mm a"
-                date_time_obj = datetime.strptime(date_time_str, "%m/%d/%y, %I:%M %p")
-                # Return in ISO format
-                return date_time_obj.isoformat()
-            except ValueError:
-                return None
-        df['Trim Created'] = df['Trim Created'].apply(convert_date_time)
-        df['Trim Modified'] = df['Trim Modified'].apply(convert_date_time)
\ No newline at end of file
+
@@ -1,15 +1,12 @@
-from mappy import Mappy
-import pandas as pd
+from mappy import Mappy, ParseDate
 
 class TestMappy(Mappy):
     
     name = "test"
     
+    transforms = [ParseDate("epoch_timestamp", unit="ms")]
+    
     def manualMappings(self):
         """Infer Elasticsearch mapping from pandas DataFrame"""
         return {}
-        
-        
-    def additionalColumn(self,df):
-        col = "epoch_timestamp"
-        df[col] = pd.to_datetime(df[col])
\ No newline at end of file
+
@@ -0,0 +1,413 @@
+import copy
+import json
+import math
+import re
+import pandas as pd
+
+
+class CostBudget:
+    """
+    Limits a query has to stay under before it is run.
+
+    Args:
+        max_cost: PostgreSQL planner cost units
+        max_rows: Estimated rows returned (PostgreSQL) or visited (SQLite)
+        max_buckets: Estimated aggregation buckets of an Elasticsearch query
+        max_terms_size: terms and composite sizes above this are lowered to it
+        max_hits: Elasticsearch size above this is lowered to it
+    """
+
+    def __init__(self, max_cost=1e6, max_rows=1e6, max_buckets=10000, max_terms_size=1000, max_hits=1000):
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.max_buckets = max_buckets
+        self.max_terms_size = max_terms_size
+        self.max_hits = max_hits
+
+
+def cost_budget(config):
+    """Budget from the .env settings"""
+    return CostBudget(
+        max_cost=float(config.get("max_query_cost", 1e6)),
+        max_rows=float(config.get("max_query_rows", 1e6)),
+        max_buckets=int(config.get("max_buckets", 10000)),
+        max_terms_size=int(config.get("max_terms_size", 1000)),
+        max_hits=int(config.get("max_hits", 1000)),
+    )
+
+
+class QueryCost:
+    """
+    Estimate of a query, and the query to run instead when it had to be rewritten.
+
+    reasons lists why the query is over budget or invalid, an empty list means it can run.
+    """
+
+    def __init__(self, query, cost=None, rows=None, buckets=None, reasons=None, rewrites=None):
+        self.query = query
+        self.cost = cost
+        self.rows = rows
+        self.buckets = buckets
+        self.reasons = reasons or []
+        self.rewrites = rewrites or []
+
+    @property
+    def over_budget(self):
+        return bool(self.reasons)
+
+    def summary(self):
+        parts = []
+        if self.cost is not None:
+            parts.append(f"cost {self.cost:,.0f}")
+        if self.rows is not None:
+            parts.append(f"~{self.rows:,.0f} rows")
+        if self.buckets is not None:
+            parts.append(f"~{self.buckets:,.0f} buckets")
+        return "Estimated " + ", ".join(parts) if parts else "No estimate"
+
+
+# Elasticsearch
+
+# Milliseconds per interval unit, months, quarters and years are averages
+INTERVAL_MS = {
+    "ms": 1, "s": 1000, "m": 60000, "h": 3600000, "d": 86400000, "w": 604800000,
+    "M": 2629746000, "q": 7889238000, "y": 31556952000,
+}
+CALENDAR_UNITS = {
+    "minute": "m", "hour": "h", "day": "d", "week": "w", "month": "M", "quarter": "q", "year": "y",
+}
+TERMS_AGGS = {"terms", "significant_terms", "multi_terms", "composite"}
+SINGLE_BUCKET_AGGS = {"filter", "global", "nested", "reverse_nested", "missing", "sampler", "diversified_sampler", "children", "parent"}
+# Buckets assumed when a histogram's field range cannot be read
+DEFAULT_HISTOGRAM_BUCKETS = 100
+
+
+def as_int(value):
+    """A size or count from a query body as an int, None when it is not a number"""
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _agg_type(agg):
+    return next((key for key in agg if key not in ("aggs", "aggregations", "meta")), None)
+
+
+def _sub_aggs(agg):
+    return agg.get("aggs") or agg.get("aggregations") or {}
+
+
+def _interval_ms(spec):
+    """Length of a date_histogram interval such as "1d", "month" or "12h" in milliseconds"""
+    interval = spec.get("calendar_interval") or spec.get("fixed_interval") or spec.get("interval")
+    if interval is None:
+        return None
+    interval = str(interval)
+    if interval in CALENDAR_UNITS:
+        return INTERVAL_MS[CALENDAR_UNITS[interval]]
+    match = re.fullmatch(r"(\d+)(ms|s|m|h|d|w|M|q|y)", interval)
+    if not match:
+        return None
+    return int(match.group(1)) * INTERVAL_MS[match.group(2)]
+
+
+def _field_range(es, index_name, field):
+    response = es.search(
+        index=index_name,
+        size=0,
+        aggs={"low": {"min": {"field": field}}, "high": {"max": {"field": field}}},
+    )
+    low = response["aggregations"]["low"]["value"]
+    high = response["aggregations"]["high"]["value"]
+    return None if low is None or high is None else (low, high)
+
+
+def _histogram_buckets(es, index_name, agg_type, spec):
+    interval = _interval_ms(spec) if agg_type == "date_histogram" else spec.get("interval")
+    bounds = spec.get("hard_bounds") or spec.get("extended_bounds")
+    try:
+        if bounds and isinstance(bounds.get("min"), (int, float)) and isinstance(bounds.get("max"), (int, float)):
+            field_range = (bounds["min"], bounds["max"])
+        else:
+            field_range = _field_range(es, index_name, spec["field"])
+    except Exception:
+        field_range = None
+    if not interval or field_range is None:
+        return DEFAULT_HISTOGRAM_BUCKETS
+    return math.floor((field_range[1] - field_range[0]) / float(interval)) + 1
+
+
+def count_buckets(es, index_name, aggs, parent=1):
+    """
+    Upper bound of the buckets aggs produces, nested buckets multiply.
+
+    Histogram bucket counts come from the field's whole range, so a query
+    filter only makes the real number smaller.
+    """
+    total = 0
+    for agg in aggs.values():
+        agg_type = _agg_type(agg)
+        spec = agg.get(agg_type) or {}
+        if agg_type in TERMS_AGGS:
+            buckets = spec.get("size", 10)
+        elif agg_type in ("date_histogram", "histogram"):
+            buckets = _histogram_buckets(es, index_name, agg_type, spec)
+        elif agg_type == "auto_date_histogram":
+            buckets = spec.get("buckets", 10)
+        elif agg_type in ("range", "date_range", "ip_range"):
+            buckets = len(spec.get("ranges", []))
+        elif agg_type == "filters":
+            buckets = len(spec.get("filters", {})) + (1 if spec.get("other_bucket") or spec.get("other_bucket_key") else 0)
+        elif agg_type in ("geohash_grid", "geotile_grid", "geohex_grid"):
+            buckets = spec.get("size", 10000)
+        elif agg_type in SINGLE_BUCKET_AGGS:
+            buckets = 1
+        else:
+            # Metric aggregations add no buckets
+            continue
+        total += parent * buckets + count_buckets(es, index_name, _sub_aggs(agg), parent * buckets)
+    return total
+
+
+def _clamp_terms(aggs, max_size, rewrites, path=""):
+    for name, agg in aggs.items():
+        if not isinstance(agg, dict):
+            continue
+        agg_type = _agg_type(agg)
+        spec = agg.get(agg_type)
+        if agg_type in TERMS_AGGS and isinstance(spec, dict) and (as_int(spec.get("size", 10)) or 0) > max_size:
+            rewrites.append(f"{path}{name} size {spec['size']} -> {max_size}")
+            spec["size"] = max_size
+        _clamp_terms(_sub_aggs(agg), max_size, rewrites, f"{path}{name} > ")
+
+
+def estimate_es_query(es, index_name, query_body, budget):
+    """
+    Validate query_body, count the documents it matches and estimate its buckets.
+
+    Oversized terms, composite and hit sizes are lowered to the budget. The
+    query is over budget when it does not validate or still has too many buckets.
+    """
+    if not isinstance(query_body, dict):
+        return QueryCost(query_body, reasons=["Invalid query: the body has to be a JSON object"])
+    query_body = copy.deepcopy(query_body)
+    rewrites = []
+    size = as_int(query_body.get("size", 10))
+    if size is None:
+        return QueryCost(query_body, reasons=[f"Invalid query: size {query_body['size']!r} is not a number"])
+    if size > budget.max_hits:
+        rewrites.append(f"size {size} -> {budget.max_hits}")
+        query_body["size"] = budget.max_hits
+    aggs = query_body.get("aggs") or query_body.get("aggregations") or {}
+    if not isinstance(aggs, dict):
+        return QueryCost(query_body, reasons=["Invalid query: aggs has to be a JSON object"])
+    _clamp_terms(aggs, budget.max_terms_size, rewrites)
+    estimate = QueryCost(query_body, rewrites=rewrites)
+
+    try:
+        if "query" in query_body:
+            validation = es.indices.validate_query(index=index_name, query=query_body["query"], explain=True)
+            if not validation["valid"]:
+                errors = [item.get("error", "") for item in validation.get("explanations", []) if item.get("error")]
+                estimate.reasons.append("Invalid query: " + ("; ".join(errors) or "rejected by validate_query"))
+                return estimate
+        estimate.rows = es.count(index=index_name, query=query_body.get("query", {"match_all": {}}))["count"]
+        estimate.buckets = count_buckets(es, index_name, aggs)
+    except Exception as e:
+        estimate.reasons.append(f"Could not estimate: {e}")
+        return estimate
+
+    if estimate.buckets > budget.max_buckets:
+        estimate.reasons.append(f"~{estimate.buckets:,} buckets is over the budget of {budget.max_buckets:,}")
+    return estimate
+
+
+# SQL
+
+# Plan rows of SELECT without FROM and of VALUES: SCAN CONSTANT ROW, SCAN 3 CONSTANT ROWS
+CONSTANT_ROWS = re.compile(r"(?:(\d+) )?CONSTANT ROWS?")
+AGGREGATE_FUNCTION = re.compile(r"\b(count|sum|avg|min|max|total|group_concat|string_agg|array_agg)\s*\(", re.I)
+
+
+def is_select(query):
+    return re.match(r"\s*(select|with)\b", query, re.I) is not None
+
+
+def trailing_limit(query):
+    """Rows up to the end of the query's trailing LIMIT clause, the offset included, None without one"""
+    match = re.search(r"\blimit\s+(\d+)(?:\s+offset\s+(\d+))?\s*;?\s*$", query, re.I)
+    return None if match is None else int(match.group(1)) + int(match.group(2) or 0)
+
+
+def has_limit(query):
+    """Whether the query ends in a LIMIT clause"""
+    return trailing_limit(query) is not None
+
+
+def append_limit(query, limit):
+    # On its own line, so a trailing -- comment cannot swallow it
+    return f"{query.rstrip().rstrip(';').rstrip()}\nLIMIT {int(limit)}"
+
+
+def _explain_postgres(conn, query):
+    plan = pd.read_sql_query("EXPLAIN (FORMAT JSON) " + query.rstrip().rstrip(";"), conn).iloc[0, 0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    top = plan[0]["Plan"]
+    return top["Total Cost"], top["Plan Rows"]
+
+
+def estimate_postgres_query(conn, query, budget):
+    """
+    Planner cost and row estimate from EXPLAIN, the query is not run.
+
+    A SELECT returning more than max_rows rows gets a LIMIT and is planned
+    again, it is over budget when the cost is still too high.
+    """
+    estimate = QueryCost(query)
+    try:
+        estimate.cost, estimate.rows = _explain_postgres(conn, query)
+        if estimate.rows > budget.max_rows and is_select(query) and not has_limit(query):
+            limited = append_limit(query, budget.max_rows)
+            estimate.cost, estimate.rows = _explain_postgres(conn, limited)
+            estimate.query = limited
+            estimate.rewrites.append(f"LIMIT {int(budget.max_rows):,} added")
+    except Exception as e:
+        estimate.reasons.append(f"Invalid query: {e}")
+        return estimate
+
+    if estimate.cost > budget.max_cost:
+        estimate.reasons.append(f"Cost {estimate.cost:,.0f} is over the budget of {budget.max_cost:,.0f}")
+    if estimate.rows > budget.max_rows:
+        estimate.reasons.append(f"~{estimate.rows:,.0f} rows is over the budget of {budget.max_rows:,.0f}")
+    return estimate
+
+
+def sqlite_table_sizes(conn):
+    """Rows per table, from sqlite_stat1 after ANALYZE, otherwise max(rowid) which needs no scan"""
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    sizes = {}
+    if "sqlite_stat1" in tables:
+        for table, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1"):
+            if stat:
+                sizes[table] = max(sizes.get(table, 0), int(stat.split()[0]))
+    for table in tables:
+        if table in sizes or table.startswith("sqlite_"):
+            continue
+        quoted = '"' + table.replace('"', '""') + '"'
+        try:
+            sizes[table] = conn.execute(f"SELECT max(rowid) FROM {quoted}").fetchone()[0] or 0
+        except Exception:
+            # WITHOUT ROWID tables
+            sizes[table] = conn.execute(f"SELECT count(*) FROM {quoted}").fetchone()[0]
+    return sizes
+
+
+def _sqlite_aliases(query):
+    aliases = {}
+    pattern = r'\b(?:from|join)\s+("(?:[^"]|"")+"|\w+)(?:\s+(?:as\s+)?(\w+))?'
+    for table, alias in re.findall(pattern, query, re.I):
+        table = table[1:-1].replace('""', '"') if table.startswith('"') else table
+        aliases[table] = table
+        if alias and alias.lower() not in ("where", "join", "on", "inner", "left", "right", "cross", "natural", "group", "order", "limit", "union", "using"):
+            aliases[alias] = table
+    return aliases
+
+
+def _sqlite_ctes(query):
+    """Names the query defines in a WITH clause"""
+    pattern = r'(?:\bwith(?:\s+recursive)?|,)\s*("(?:[^"]|"")+"|\w+)\s*(?:\([^)]*\)\s*)?as\s*(?:(?:not\s+)?materialized\s*)?\('
+    return {
+        name[1:-1].replace('""', '"') if name.startswith('"') else name
+        for name in re.findall(pattern, query, re.I)
+    }
+
+
+def estimate_sqlite_rows(conn, query):
+    """
+    Upper bound of the rows sqlite visits, from EXPLAIN QUERY PLAN.
+
+    Full scans in the same loop nest multiply, index lookups count a quarter
+    of the table for a range, 1 row for a primary key equality and 10 for
+    another equality (sqlite's own default). Separate parts of a compound
+    query add up.
+    Constant rows, table valued functions and WITH tables, whose own rows
+    are counted where they are computed, count as 1 row each.
+
+    Returns:
+        (rows, whether the plan sorts or groups in a temp b-tree)
+    """
+    plan = conn.execute("EXPLAIN QUERY PLAN " + query.rstrip().rstrip(";")).fetchall()
+    sizes = sqlite_table_sizes(conn)
+    aliases = _sqlite_aliases(query)
+    ctes = _sqlite_ctes(query)
+    largest = max(sizes.values(), default=0)
+
+    loops = {}
+    temp_btree = False
+    for _, parent, _, detail in plan:
+        if "TEMP B-TREE" in detail:
+            temp_btree = True
+        match = re.match(r"(SCAN|SEARCH) (?:TABLE )?(.+?)(?: USING (.*))?$", detail)
+        if not match or match.group(2).startswith("("):
+            continue
+        name = match.group(2)
+        constant = CONSTANT_ROWS.fullmatch(name)
+        if constant:
+            loops[parent] = loops.get(parent, 1) * int(constant.group(1) or 1)
+            continue
+        virtual = " VIRTUAL TABLE" in name
+        name = re.sub(r" VIRTUAL TABLE.*$", "", name)
+        name = re.sub(r" AS \w+$", "", name)
+        table = aliases.get(name, name)
+        if table in sizes:
+            size = sizes[table]
+        elif virtual or name in ctes:
+            size = 1
+        else:
+            # A table the aliases missed, assume the largest
+            size = largest
+        using = match.group(3) or ""
+        if match.group(1) == "SCAN":
+            factor = size
+        elif ">" in using or "<" in using:
+            # Before the primary key check, INTEGER PRIMARY KEY (rowid>?) is a range too
+            factor = max(1, size // 4)
+        elif "PRIMARY KEY" in using or "rowid=" in using:
+            factor = 1
+        else:
+            factor = 10
+        loops[parent] = loops.get(parent, 1) * max(factor, 1)
+    return sum(loops.values()), temp_btree
+
+
+def estimate_sqlite_query(conn, query, budget):
+    """
+    Estimated rows visited from the query plan, the query is not run.
+
+    A SELECT that visits more than max_rows rows without sorting, grouping or
+    aggregating stops early once it has a LIMIT, so its own LIMIT caps the
+    estimate and one is added when it has none.
+    """
+    estimate = QueryCost(query)
+    try:
+        estimate.rows, temp_btree = estimate_sqlite_rows(conn, query)
+    except Exception as e:
+        estimate.reasons.append(f"Invalid query: {e}")
+        return estimate
+
+    streams = not temp_btree and not AGGREGATE_FUNCTION.search(query)
+    limit = trailing_limit(query)
+    if streams and limit is not None:
+        estimate.rows = min(estimate.rows, limit)
+    if estimate.rows > budget.max_rows:
+        if streams and is_select(query) and limit is None:
+            estimate.query = append_limit(query, budget.max_rows)
+            estimate.rows = budget.max_rows
+            estimate.rewrites.append(f"LIMIT {int(budget.max_rows):,} added")
+        else:
+            estimate.reasons.append(f"~{estimate.rows:,.0f} rows visited is over the budget of {budget.max_rows:,.0f}")
+    return estimate
@@ -0,0 +1,166 @@
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+import pandas as pd
+from queryCost import append_limit, as_int, has_limit, is_select
+
+
+class Limits:
+    """
+    Result size and runtime limits applied to every query a bot runs.
+
+    Args:
+        max_rows: Rows or hits returned, one more is fetched to tell when a result was cut off
+        timeout: Seconds a query may run
+        terminate_after: Documents collected per shard before Elasticsearch stops, 0 for no limit
+        track_total_hits: Hits Elasticsearch counts exactly before reporting a lower bound
+    """
+
+    def __init__(self, max_rows=1000, timeout=30, terminate_after=0, track_total_hits=10000):
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.terminate_after = terminate_after
+        self.track_total_hits = track_total_hits
+
+
+def limits_for(config, widget=None):
+    """
+    Limits from the .env settings, overridden by the same keys on a saved widget.
+
+    A widget in the saved widgets json can set "max_rows", "timeout",
+    "terminate_after" and "track_total_hits".
+    """
+    widget = widget or {}
+    return Limits(
+        max_rows=int(widget.get("max_rows", config.get("result_max_rows", 1000))),
+        timeout=float(widget.get("timeout", config.get("query_timeout", 30))),
+        terminate_after=int(widget.get("terminate_after", config.get("es_terminate_after", 0))),
+        track_total_hits=int(widget.get("track_total_hits", config.get("es_track_total_hits", 10000))),
+    )
+
+
+# Elasticsearch
+
+TIME_UNITS_MS = {"nanos": 1e-6, "micros": 1e-3, "ms": 1, "s": 1000, "m": 60000, "h": 3600000, "d": 86400000}
+
+
+def _time_ms(value):
+    match = re.fullmatch(r"(\d+)(nanos|micros|ms|s|m|h|d)", str(value))
+    return int(match.group(1)) * TIME_UNITS_MS[match.group(2)] if match else None
+
+
+def guard_es_query(query_body, limits):
+    """
+    Copy of query_body with size, timeout, terminate_after and track_total_hits capped.
+
+    Values already in the query are kept when they are within the limits.
+    A body that is not a JSON object is returned as is, Elasticsearch rejects it.
+    """
+    if not isinstance(query_body, dict):
+        return query_body
+    query_body = dict(query_body)
+    size = as_int(query_body.get("size", 10))
+    if size is None or size > limits.max_rows:
+        query_body["size"] = limits.max_rows
+
+    current = _time_ms(query_body.get("timeout"))
+    if current is None or current > limits.timeout * 1000:
+        query_body["timeout"] = f"{int(limits.timeout * 1000)}ms"
+
+    terminate_after = as_int(query_body.get("terminate_after", 0))
+    if limits.terminate_after and not 0 < (terminate_after or 0) <= limits.terminate_after:
+        query_body["terminate_after"] = limits.terminate_after
+
+    track = query_body.get("track_total_hits")
+    if track is None or track is True or (track is not False and not 0 <= (as_int(track) or 0) <= limits.track_total_hits):
+        query_body["track_total_hits"] = limits.track_total_hits
+    return query_body
+
+
+def es_truncation(results):
+    """Message saying how an Elasticsearch result was cut short, or None when it is complete"""
+    results = getattr(results, "body", results)
+    if not isinstance(results, dict):
+        return None
+    messages = []
+    if results.get("timed_out"):
+        messages.append("The query timed out, results are partial.")
+    if results.get("terminated_early"):
+        messages.append("The query stopped early at terminate_after, results are partial.")
+    hits = results.get("hits", {})
+    total = hits.get("total")
+    shown = len(hits.get("hits", []))
+    if isinstance(total, dict):
+        relation = "more than " if total.get("relation") == "gte" else ""
+        total = total.get("value")
+    else:
+        relation = ""
+    if total is not None and 0 < shown < total:
+        messages.append(f"Showing {shown:,} of {relation}{total:,} hits.")
+    return " ".join(messages) or None
+
+
+# SQL
+
+def limit_sql(query, max_rows):
+    """
+    SELECT limited to max_rows + 1 rows, the extra row tells that the result was cut off.
+
+    Other statements are returned unchanged.
+    """
+    if not is_select(query):
+        return query
+    if not has_limit(query):
+        return append_limit(query, max_rows + 1)
+    limit = int(re.search(r"\blimit\s+(\d+)(\s+offset\s+\d+)?\s*;?\s*$", query, re.I).group(1))
+    if limit <= max_rows:
+        return query
+    return f"SELECT * FROM (\n{query.rstrip().rstrip(';')}\n) AS limited LIMIT {max_rows + 1}"
+
+
+def read_sql_limited(query, conn, limits, read=pd.read_sql_query):
+    """
+    Run query with a LIMIT.
+
+    Args:
+        read: Function of (query, conn) returning a DataFrame or pyarrow Table
+
+    Returns:
+        (result of at most limits.max_rows rows, whether rows were cut off)
+    """
+    result = read(limit_sql(query, limits.max_rows), conn)
+    if len(result) > limits.max_rows:
+        return result[:limits.max_rows], True
+    return result, False
+
+
+def postgres_statement_timeout(conn, seconds):
+    """Cancel statements of the current transaction that run longer than seconds"""
+    statement = f"SET LOCAL statement_timeout = {int(seconds * 1000)}"
+    if hasattr(conn, "exec_driver_sql"):
+        conn.exec_driver_sql(statement)
+    else:
+        with conn.cursor() as cursor:
+            cursor.execute(statement)
+
+
+@contextmanager
+def sqlite_deadline(conn, seconds):
+    """Interrupt the statements run inside the block once seconds have passed"""
+    deadline = time.monotonic() + seconds
+    # Checked every 10000 virtual machine instructions, a fraction of a millisecond
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
+    try:
+        yield
+    except (sqlite3.OperationalError, pd.errors.DatabaseError) as e:
+        # pandas wraps the sqlite error in its own DatabaseError
+        if str(e).endswith("interrupted"):
+            raise TimeoutError(f"Query stopped after {seconds:g} seconds") from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def truncation_message(limits):
+    return f"Showing the first {limits.max_rows:,} rows, the result was cut off."
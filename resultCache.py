@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+GENERATIONS_FILE = ".generations.json"
+
+
+def es_fingerprint(query_body):
+    """Stable hash of an Elasticsearch query body, independent of key order and formatting"""
+    text = json.dumps(query_body, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+# String literals and quoted identifiers (with doubled quotes inside), comments, or a run of whitespace
+SQL_TOKENS = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|/\*.*?\*/|--[^\n]*\n?\s*|\s+""", re.DOTALL)
+
+
+def _normalize_token(match):
+    token = match.group()
+    if token.startswith("--"):
+        # The code after a line comment stays on its own line
+        return token.rstrip() + "\n"
+    if token[0].isspace():
+        return " "
+    return token
+
+
+def sql_fingerprint(query):
+    """Hash of a SQL query with whitespace outside of quotes collapsed and trailing semicolons removed"""
+    text = SQL_TOKENS.sub(_normalize_token, query).strip().rstrip(";").strip()
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _generations_path(directory):
+    return os.path.join(directory, GENERATIONS_FILE)
+
+
+def bump_generation(directory, backend, target):
+    """
+    Mark that new data landed in target (an index or database) so cached results are dropped.
+
+    Called by the upload scripts once a load finishes.
+    """
+    path = _generations_path(directory)
+    generations = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            generations = json.load(f)
+    key = f"{backend}:{target}"
+    generations[key] = generations.get(key, 0) + 1
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(generations, f)
+    os.replace(tmp_path, path)
+
+
+_generations = {}
+
+
+def get_generation(directory, backend, target):
+    """Current generation of target, the file is only re-read when it changed"""
+    path = _generations_path(directory)
+    if not os.path.exists(path):
+        return 0
+    mtime = os.path.getmtime(path)
+    cached = _generations.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r") as f:
+            cached = (mtime, json.load(f))
+        _generations[path] = cached
+    return cached[1].get(f"{backend}:{target}", 0)
+
+
+class ResultCache:
+    """Process-wide LRU cache of widget results with a TTL per entry"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Cached value for key, or None when missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+_result_cache = None
+
+
+def get_result_cache(max_entries=256):
+    """
+    The cache shared by every Streamlit rerun and session of this process.
+
+    Imported modules survive reruns, so a module level instance lives as long as the server.
+    """
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(max_entries)
+    return _result_cache
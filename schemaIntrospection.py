@@ -0,0 +1,104 @@
+import threading
+import pandas as pd
+
+
+# (backend, target) -> (schema version, schema), shared by every rerun of this process
+_schemas = {}
+_lock = threading.Lock()
+
+
+def cached_schema(backend, target, version, load):
+    """
+    Return the cached schema of target while its version is unchanged, calling load otherwise.
+
+    Args:
+        backend: "postgres", "sqlite" or "elasticsearch"
+        target: Database or index name
+        version: Cheap value that changes whenever the schema changes
+        load: Function returning the full schema
+    """
+    key = (backend, target)
+    with _lock:
+        entry = _schemas.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    schema = load()
+    with _lock:
+        _schemas[key] = (version, schema)
+    return schema
+
+
+def _split_by_table(columns, table_column, keep):
+    return {
+        table: rows[keep].reset_index(drop=True)
+        for table, rows in columns.groupby(table_column, sort=False)
+    }
+
+
+def postgres_schema_version(conn):
+    """
+    Fingerprint of the public schema's catalog rows.
+
+    xmin changes whenever a pg_class or pg_attribute row is rewritten, so any
+    CREATE, DROP or ALTER of a table or column gives a new value.
+    """
+    query = """
+    SELECT count(*) AS columns,
+           coalesce(max(a.xmin::text::bigint), 0) AS attribute_xmin,
+           coalesce(max(c.xmin::text::bigint), 0) AS class_xmin
+    FROM pg_attribute a
+    JOIN pg_class c ON c.oid = a.attrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'v', 'm', 'p', 'f')
+      AND a.attnum > 0 AND NOT a.attisdropped;
+    """
+    return tuple(pd.read_sql_query(query, conn).iloc[0])
+
+
+def get_postgres_schema(conn, db_name):
+    """Column name and data type of every public table, from one information_schema query"""
+    def load():
+        query = """
+        SELECT table_name, column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+        ORDER BY table_name, ordinal_position;
+        """
+        columns = pd.read_sql_query(query, conn)
+        return _split_by_table(columns, "table_name", ["column_name", "data_type"])
+
+    return cached_schema("postgres", db_name, postgres_schema_version(conn), load)
+
+
+def get_sqlite_schema(conn, db_file):
+    """Column name and type of every table, from one pragma_table_info join"""
+    def load():
+        query = """
+        SELECT m.name AS table_name, p.name, p.type
+        FROM sqlite_master m
+        JOIN pragma_table_info(m.name) p
+        WHERE m.type = 'table'
+        ORDER BY m.name, p.cid;
+        """
+        columns = pd.read_sql_query(query, conn)
+        return _split_by_table(columns, "table_name", ["name", "type"])
+
+    # schema_version is incremented by sqlite on every schema change
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    return cached_schema("sqlite", db_file, version, load)
+
+
+def get_es_mapping(es, index_name):
+    """Index mapping, only fetched again when the index's mapping_version changes"""
+    try:
+        state = es.cluster.state(
+            metric="metadata",
+            index=index_name,
+            filter_path="metadata.indices.*.mapping_version",
+        )
+        version = state["metadata"]["indices"][index_name]["mapping_version"]
+    except Exception:
+        # No permission to read the cluster state, fall back to fetching the mapping
+        return es.indices.get_mapping(index=index_name)
+    return cached_schema("elasticsearch", index_name, version, lambda: es.indices.get_mapping(index=index_name))
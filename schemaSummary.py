@@ -0,0 +1,237 @@
+import re
+import pandas as pd
+from llmCache import schema_hash
+from schemaIntrospection import cached_schema
+
+
+# Elasticsearch types that support aggregations, text fields only get examples from sampled documents
+AGGREGATABLE = {
+    "keyword", "constant_keyword", "boolean", "ip", "date", "date_nanos",
+    "long", "integer", "short", "byte", "double", "float", "half_float", "scaled_float", "unsigned_long",
+}
+RANGE_TYPES = {
+    "date", "date_nanos", "long", "integer", "short", "byte",
+    "double", "float", "half_float", "scaled_float", "unsigned_long",
+}
+MAX_EXAMPLE_LENGTH = 40
+
+
+def estimate_tokens(text):
+    """Rough token count, about four characters per token for English and JSON"""
+    return len(text) // 4 + 1
+
+
+def _words(text):
+    # Split snake_case, dotted paths and camelCase, and drop plural s so "prices" matches "price"
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text))
+    words = set()
+    for word in re.findall(r"[A-Za-z0-9]+", text.lower()):
+        if len(word) > 3 and word.endswith("s"):
+            word = word[:-1]
+        words.add(word)
+    return words
+
+
+def _example(value):
+    text = f"{value:.6g}" if isinstance(value, float) else str(value)
+    if len(text) > MAX_EXAMPLE_LENGTH:
+        text = text[:MAX_EXAMPLE_LENGTH - 3] + "..."
+    return text
+
+
+def relevance(request_words, name, examples=(), table=None):
+    """Score of a field for a request, matching name words count more than example values"""
+    name_words = _words(name)
+    score = 3 * len(name_words & request_words)
+    joined = str(name).lower().replace("_", "")
+    score += sum(1 for word in request_words if len(word) > 3 and word not in name_words and word in joined)
+    for example in examples:
+        score += len(_words(example) & request_words)
+    if table is not None:
+        score += len(_words(table) & request_words)
+    return score
+
+
+def describe(field):
+    """One field as '"name" type, ~N distinct, e.g. a | b' or '"name" type, min..max'"""
+    name = '"' + field["name"].replace('"', '""') + '"'
+    text = f"{name} {field['type']}"
+    if field.get("cardinality") is not None:
+        text += f", ~{field['cardinality']} distinct"
+    if field.get("range"):
+        text += f", {field['range'][0]}..{field['range'][1]}"
+    elif field.get("examples"):
+        text += ", e.g. " + " | ".join(field["examples"])
+    return text
+
+
+def rank_fields(fields, request):
+    """Fields sorted by relevance to request, ties keep their schema order"""
+    request_words = _words(request)
+    scored = [
+        (-relevance(request_words, field["name"], field.get("examples", ()), field.get("table")), i, field)
+        for i, field in enumerate(fields)
+    ]
+    return [field for _, _, field in sorted(scored, key=lambda item: item[:2])]
+
+
+def select_within_budget(fields, budget):
+    """Leading fields whose descriptions fit in budget tokens, at least one"""
+    selected = []
+    used = 0
+    for field in fields:
+        tokens = estimate_tokens(describe(field)) + 1
+        if selected and used + tokens > budget:
+            break
+        selected.append(field)
+        used += tokens
+    return selected
+
+
+def flatten_es_mapping(properties, prefix=""):
+    """(path, type) of every field in an index mapping, including object children and multi-fields"""
+    fields = []
+    for name, info in properties.items():
+        path = f"{prefix}{name}"
+        if "properties" in info:
+            fields.append({"name": path, "type": info.get("type", "object")})
+            fields.extend(flatten_es_mapping(info["properties"], f"{path}."))
+            continue
+        fields.append({"name": path, "type": info.get("type", "object")})
+        for sub_name, sub_info in info.get("fields", {}).items():
+            fields.append({"name": f"{path}.{sub_name}", "type": sub_info.get("type", "object")})
+    return fields
+
+
+def es_field_stats(es, index_name, fields, sample_size):
+    """
+    Add cardinality, ranges and examples to fields from one sampled search.
+
+    A sampler aggregation looks at sample_size documents per shard, so the
+    cost does not grow with the index. Text fields take examples from the
+    first few sampled documents.
+    """
+    aggs = {}
+    for i, field in enumerate(fields):
+        if field["type"] not in AGGREGATABLE:
+            continue
+        aggs[f"c{i}"] = {"cardinality": {"field": field["name"], "precision_threshold": 100}}
+        if field["type"] in RANGE_TYPES:
+            aggs[f"min{i}"] = {"min": {"field": field["name"]}}
+            aggs[f"max{i}"] = {"max": {"field": field["name"]}}
+        else:
+            aggs[f"t{i}"] = {"terms": {"field": field["name"], "size": 3}}
+
+    response = es.search(
+        index=index_name,
+        size=3,
+        query={"match_all": {}},
+        aggs={"sample": {"sampler": {"shard_size": sample_size}, "aggs": aggs}} if aggs else None,
+    )
+    sample = response.get("aggregations", {}).get("sample", {})
+    documents = [hit.get("_source", {}) for hit in response["hits"]["hits"]]
+
+    def source_value(document, path):
+        for part in path.split("."):
+            if not isinstance(document, dict) or part not in document:
+                return None
+            document = document[part]
+        return document
+
+    def bound(agg):
+        return agg.get("value_as_string", agg.get("value"))
+
+    for i, field in enumerate(fields):
+        if f"c{i}" in sample:
+            field["cardinality"] = sample[f"c{i}"]["value"]
+        if f"min{i}" in sample and sample[f"min{i}"].get("value") is not None:
+            field["range"] = (_example(bound(sample[f"min{i}"])), _example(bound(sample[f"max{i}"])))
+        elif f"t{i}" in sample:
+            field["examples"] = [_example(bucket.get("key_as_string", bucket["key"])) for bucket in sample[f"t{i}"]["buckets"]]
+        elif field["type"] == "text":
+            values = [source_value(document, field["name"]) for document in documents]
+            field["examples"] = [_example(value) for value in values if value is not None and not isinstance(value, (dict, list))][:2]
+    return fields
+
+
+def summarize_es_mapping(es, index_name, mapping, request, budget=1500, generation=0, stats=True, sample_size=1000):
+    """
+    Compact description of an index for a prompt, most relevant fields first.
+
+    Field statistics are sampled once per mapping and data generation, ranking
+    and trimming to budget tokens happen for every request.
+    """
+    def load():
+        properties = mapping[index_name]["mappings"].get("properties", {})
+        fields = flatten_es_mapping(properties)
+        if stats:
+            try:
+                es_field_stats(es, index_name, fields, sample_size)
+            except Exception as e:
+                print(f"Could not sample field statistics: {e}")
+        return fields
+
+    fields = cached_schema("elasticsearch_summary", index_name, (schema_hash(mapping), generation), load)
+    selected = select_within_budget(rank_fields(fields, request), budget)
+    lines = [f"Index {index_name}, {len(fields)} fields, most relevant first:"]
+    lines.extend(describe(field) for field in selected)
+    if len(selected) < len(fields):
+        lines.append(f"({len(fields) - len(selected)} less relevant fields omitted)")
+    return "\n".join(lines)
+
+
+def sql_field_stats(conn, table, fields, sample_size):
+    """Add cardinality and ranges or examples to the columns of table, from its first sample_size rows"""
+    quoted = '"' + table.replace('"', '""') + '"'
+    sample = pd.read_sql_query(f"SELECT * FROM {quoted} LIMIT {int(sample_size)}", conn)
+    for field in fields:
+        if field["name"] not in sample.columns:
+            continue
+        values = sample[field["name"]].dropna()
+        field["cardinality"] = int(values.nunique())
+        if values.empty:
+            continue
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            field["range"] = (_example(values.min()), _example(values.max()))
+        else:
+            field["examples"] = [_example(value) for value in values.astype(str).value_counts().index[:3]]
+    return fields
+
+
+def summarize_sql_schema(backend, target, schemas, request, connect=None, budget=1500, generation=0, sample_size=1000):
+    """
+    Compact description of the tables for a prompt, grouped by table and most relevant first.
+
+    Args:
+        schemas: Dict of table name to a DataFrame of column name and type
+        connect: Context manager factory returning a connection for sampling
+            statistics, statistics are left out when None
+    """
+    def load():
+        fields = []
+        for table, columns in schemas.items():
+            table_fields = [
+                {"table": table, "name": str(name), "type": str(column_type)}
+                for name, column_type in columns.iloc[:, :2].itertuples(index=False)
+            ]
+            if connect is not None:
+                try:
+                    with connect() as conn:
+                        sql_field_stats(conn, table, table_fields, sample_size)
+                except Exception as e:
+                    print(f"Could not sample statistics of {table}: {e}")
+            fields.extend(table_fields)
+        return fields
+
+    fields = cached_schema(f"{backend}_summary", target, (schema_hash(schemas), generation), load)
+    selected = select_within_budget(rank_fields(fields, request), budget)
+
+    # Tables in the order of their most relevant column, columns stay in relevance order
+    tables = {}
+    for field in selected:
+        tables.setdefault(field["table"], []).append(describe(field))
+    lines = [f"{len(schemas)} tables, {len(fields)} columns, most relevant first:"]
+    lines.extend(f"{table}: " + "; ".join(columns) for table, columns in tables.items())
+    if len(selected) < len(fields):
+        lines.append(f"({len(fields) - len(selected)} less relevant columns omitted)")
+    return "\n".join(lines)
@@ -0,0 +1,196 @@
+import io
+import re
+import pandas as pd
+from psycopg2 import errors, sql
+
+
+INTEGER = re.compile(r"^[+-]?\d+$")
+FLOAT = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+TIMESTAMP = re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?$")
+BOOLEANS = {"true", "false"}
+# Context postgres gives a COPY conversion error: COPY orders, line 3, column amount: "n/a"
+COPY_COLUMN = re.compile(r"^COPY .+, line \d+, column (.+?): (.*)$", re.MULTILINE)
+
+POSTGRES_TYPES = {
+    "integer": "BIGINT",
+    "float": "DOUBLE PRECISION",
+    "boolean": "BOOLEAN",
+    "date": "DATE",
+    "timestamp": "TIMESTAMP",
+    "text": "TEXT",
+}
+
+
+SQLITE_TYPES = {
+    "integer": "INTEGER",
+    "float": "REAL",
+    "boolean": "INTEGER",
+    "date": "TEXT",
+    "timestamp": "TEXT",
+    "text": "TEXT",
+}
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def clean_columns(df):
+    """Replace spaces in column names, as every loader does"""
+    df.columns = df.columns.str.replace(" ", "_")
+
+
+def read_text_chunks(csv_file, chunk_size, mutate=None):
+    """
+    Read the CSV in chunks with every column kept as text.
+
+    Values reach the database exactly as written in the file instead of going
+    through pandas' per-chunk type guessing (an int column with a gap would
+    otherwise turn into 5.0 in one chunk and 5 in the next).
+    """
+    for df in pd.read_csv(csv_file, chunksize=chunk_size, dtype=str):
+        clean_columns(df)
+        if mutate:
+            mutate(df)
+        yield df
+
+
+def column_kind(values):
+    """Classify the non-null text values of one column as integer, float, boolean, date, timestamp or text"""
+    if values.empty:
+        return "text"
+    text = values.astype(str).str.strip()
+    if text.str.lower().isin(BOOLEANS).all():
+        return "boolean"
+    if text.str.match(INTEGER).all():
+        return "integer"
+    if text.str.match(FLOAT).all():
+        return "float"
+    if text.str.match(DATE).all():
+        return "date"
+    if text.str.match(TIMESTAMP).all():
+        return "timestamp"
+    return "text"
+
+
+def infer_column_kinds(csv_file, sample_rows=10000, mutate=None):
+    """Explicit column kinds from the first sample_rows rows, after the same cleaning as the load"""
+    sample = next(read_text_chunks(csv_file, sample_rows, mutate))
+    return {col: column_kind(sample[col].dropna()) for col in sample.columns}
+
+
+def _failed_column(error, kinds):
+    """(column, value) a COPY data error points at, if it is a column that can still be widened to text"""
+    match = COPY_COLUMN.search(error.diag.context or "")
+    if match is None or kinds.get(match.group(1), "text") == "text":
+        return None
+    return match.group(1), match.group(2)
+
+
+def copy_csv_to_postgres(conn, csv_file, table, chunk_size=100000, sample_rows=10000, mutate=None):
+    """
+    Replace table with the contents of the CSV using COPY ... FROM STDIN.
+
+    Column types are inferred from a sample and declared explicitly, then the
+    file is streamed chunk by chunk so it is never fully held in memory.
+    A later value that does not fit its column's type, like "n/a" in an
+    integer column, turns that column into TEXT and the chunk is sent again.
+    Runs in the connection's current transaction, the caller commits.
+
+    Args:
+        conn: psycopg2 connection to the target database
+        csv_file: Path of the CSV file
+        table: Name of the table to (re)create
+        chunk_size: Rows sent per COPY call
+        sample_rows: Rows used to infer the column types
+        mutate: Optional function applied to each chunk DataFrame in place
+
+    Returns:
+        Number of rows loaded
+    """
+    kinds = infer_column_kinds(csv_file, sample_rows, mutate)
+    columns = sql.SQL(", ").join(
+        sql.SQL("{} {}").format(sql.Identifier(col), sql.SQL(POSTGRES_TYPES[kind]))
+        for col, kind in kinds.items()
+    )
+    copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(table),
+        sql.SQL(", ").join(sql.Identifier(col) for col in kinds),
+    ).as_string(conn)
+
+    rows = 0
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table)))
+        cursor.execute(sql.SQL("CREATE TABLE {} ({})").format(sql.Identifier(table), columns))
+        for df in read_text_chunks(csv_file, chunk_size, mutate):
+            buffer = io.StringIO()
+            # Missing values are written as unquoted empty fields, which COPY reads as NULL
+            df.to_csv(buffer, index=False, header=False)
+            while True:
+                buffer.seek(0)
+                # A failed COPY only undoes this chunk, the rows before it stay
+                cursor.execute("SAVEPOINT copy_chunk")
+                try:
+                    cursor.copy_expert(copy_query, buffer)
+                except errors.DataError as error:
+                    cursor.execute("ROLLBACK TO SAVEPOINT copy_chunk")
+                    failed = _failed_column(error, kinds)
+                    if failed is None:
+                        raise
+                    col, value = failed
+                    print(f"Column {col} of {table} changed from {kinds[col]} to text, it has the value {value}")
+                    cursor.execute(sql.SQL("ALTER TABLE {} ALTER COLUMN {} TYPE TEXT").format(
+                        sql.Identifier(table), sql.Identifier(col)
+                    ))
+                    kinds[col] = "text"
+                    continue
+                cursor.execute("RELEASE SAVEPOINT copy_chunk")
+                break
+            rows += len(df)
+    return rows
+
+
+def load_csv_to_sqlite(conn, csv_file, table, chunk_size=100000, sample_rows=10000, mutate=None):
+    """
+    Replace table with the contents of the CSV using chunked executemany.
+
+    The drop, create and inserts run in one explicit transaction, so readers
+    keep seeing the old table until the new one is complete. Text values are
+    inserted as read and converted by the declared column affinity.
+
+    Args:
+        conn: sqlite3 connection, opened with isolation_level=None
+        csv_file: Path of the CSV file
+        table: Name of the table to (re)create
+        chunk_size: Rows inserted per executemany call
+        sample_rows: Rows used to infer the column types
+        mutate: Optional function applied to each chunk DataFrame in place
+
+    Returns:
+        Number of rows loaded
+    """
+    kinds = infer_column_kinds(csv_file, sample_rows, mutate)
+    columns = ", ".join(f"{_quote(col)} {SQLITE_TYPES[kind]}" for col, kind in kinds.items())
+    insert = f"INSERT INTO {_quote(table)} VALUES ({', '.join('?' for _ in kinds)})"
+    booleans = [col for col, kind in kinds.items() if kind == "boolean"]
+    dates = [col for col, kind in kinds.items() if kind in ("date", "timestamp")]
+
+    rows = 0
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+        conn.execute(f"CREATE TABLE {_quote(table)} ({columns})")
+        for df in read_text_chunks(csv_file, chunk_size, mutate):
+            for col in booleans:
+                df[col] = df[col].str.strip().str.lower().map({"true": 1, "false": 0})
+            for col in dates:
+                df[col] = df[col].astype(str).where(df[col].notna())
+            values = df.astype(object).where(df.notna(), None)
+            conn.executemany(insert, values.itertuples(index=False, name=None))
+            rows += len(df)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
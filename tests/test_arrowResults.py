@@ -0,0 +1,67 @@
+import decimal
+import math
+from types import SimpleNamespace
+import pyarrow as pa
+from arrowResults import read_postgres_arrow
+
+
+class FakeCursor:
+    """Answers the describe query with columns and COPY with csv, like a psycopg2 cursor"""
+
+    def __init__(self, columns, csv):
+        self.columns = columns
+        self.csv = csv
+
+    def execute(self, query):
+        self.description = [
+            SimpleNamespace(name=name, type_code=type_code, precision=precision, scale=scale)
+            for name, type_code, precision, scale in self.columns
+        ]
+
+    def copy_expert(self, query, buffer):
+        buffer.write(self.csv)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, columns, csv):
+        self.columns = columns
+        self.csv = csv
+
+    def cursor(self):
+        return FakeCursor(self.columns, self.csv)
+
+
+def read(columns, csv):
+    return read_postgres_arrow("SELECT 1", FakeConnection(columns, csv))
+
+
+def test_numeric_is_read_as_decimal():
+    table = read(
+        [("total", 1700, None, None), ("price", 1700, 10, 2), ("average", 1700, None, None)],
+        b"123456789012345678901,19.90,-0.3333333333333333\n,5.00,12\n",
+    )
+    assert table.schema.field("total").type == pa.decimal128(21, 0)
+    assert table.schema.field("price").type == pa.decimal128(10, 2)
+    assert table.schema.field("average").type == pa.decimal128(18, 16)
+    assert table.column("total").to_pylist() == [decimal.Decimal("123456789012345678901"), None]
+    assert table.column("average").to_pylist() == [decimal.Decimal("-0.3333333333333333"), decimal.Decimal("12")]
+
+
+def test_numeric_with_nan_stays_text():
+    table = read([("ratio", 1700, None, None)], b"1.5\nNaN\n\n")
+    assert table.column("ratio").to_pylist() == ["1.5", "NaN", None]
+
+
+def test_only_empty_fields_are_null():
+    table = read([("f", 701, None, None), ("t", 25, None, None)], b'NaN,NULL\n,""\n1.5,N/A\n')
+    f = table.column("f").to_pylist()
+    assert math.isnan(f[0]) and f[1:] == [None, 1.5]
+    assert table.column("t").to_pylist() == ["NULL", "", "N/A"]
+
+
+def test_empty_result_keeps_types():
+    table = read([("price", 1700, 10, 2), ("n", 23, None, None)], b"")
+    assert table.schema.types == [pa.decimal128(10, 2), pa.int32()]
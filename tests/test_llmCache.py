@@ -0,0 +1,21 @@
+import pandas as pd
+from elastic_transport import ObjectApiResponse
+from llmCache import schema_hash
+
+
+MAPPING = {"orders": {"mappings": {"properties": {"city": {"type": "keyword"}, "amount": {"type": "double"}}}}}
+
+
+def test_es_response_hashes_like_its_body():
+    reordered = {"orders": {"mappings": {"properties": {"amount": {"type": "double"}, "city": {"type": "keyword"}}}}}
+    response = ObjectApiResponse(body=reordered, meta=None)
+    assert schema_hash(response) == schema_hash(MAPPING)
+
+    changed = {"orders": {"mappings": {"properties": {"city": {"type": "text"}, "amount": {"type": "double"}}}}}
+    assert schema_hash(ObjectApiResponse(body=changed, meta=None)) != schema_hash(response)
+
+
+def test_table_schemas():
+    schemas = {"orders": pd.DataFrame({"name": ["body", "amount"], "type": ["TEXT", "REAL"]})}
+    assert schema_hash(schemas) == schema_hash({"orders": schemas["orders"].copy()})
+    assert schema_hash(schemas) != schema_hash({"orders": schemas["orders"].iloc[:1]})
@@ -0,0 +1,190 @@
+"""
+Streaming of LLMClient against a small local server-sent-events stub.
+
+Run with pytest from anywhere in the repository.
+"""
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from llmClient import LLMClient, QueryStreamParser
+
+
+QUERIES = [
+    {"query_name": "Orders per city", "query_body": {"size": 0, "aggs": {"cities": {"terms": {"field": "city"}}}}},
+    {"query_name": "Braces {in} \"strings\" café", "query_body": "SELECT '}' AS brace;"},
+]
+
+
+def sse_event(content):
+    # Raw UTF-8, so splitting the bytes can cut a character in two
+    return f"data: {json.dumps({'choices': [{'delta': {'content': content}}]}, ensure_ascii=False)}\n\n".encode()
+
+
+def split_every(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class StubServer:
+    """
+    Answers every POST with a script of byte strings written and flushed one by one.
+
+    An int in the script sends the status line and headers, a float sleeps
+    that many seconds, HANG waits until the test ends, so the client sees a
+    stalled stream. The body is sent with chunked transfer encoding, as
+    hosted APIs do, or without a length until the connection closes.
+    """
+
+    HANG = object()
+
+    def __init__(self, chunked):
+        self.script = []
+        self.requests = []
+        self.release = threading.Event()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" if chunked else "HTTP/1.0"
+
+            def do_POST(self):
+                stub.requests.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+                for step in stub.script:
+                    if step is StubServer.HANG:
+                        stub.release.wait()
+                        return
+                    if isinstance(step, float):
+                        time.sleep(step)
+                    elif isinstance(step, int):
+                        self.send_response(step)
+                        self.send_header("Content-Type", "text/event-stream")
+                        if chunked:
+                            self.send_header("Transfer-Encoding", "chunked")
+                        self.end_headers()
+                    else:
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(step), step) if chunked else step)
+                        self.wfile.flush()
+                if chunked:
+                    self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(params=[True, False], ids=["chunked", "until-close"])
+def stub(request):
+    server = StubServer(request.param)
+    yield server
+    server.close()
+
+
+def client(url, timeout=(1, 2)):
+    return LLMClient(url, {"Authorization": "Bearer test"}, timeout=timeout, max_retries=1, backoff=0)
+
+
+def test_parser_finds_queries_fed_one_character_at_a_time():
+    text = "Here you go:\n```json\n[\n" + ",\n".join(json.dumps(query, indent=2) for query in QUERIES) + "\n]\n```"
+    parser = QueryStreamParser()
+    found = [query for char in text for query in parser.feed(char)]
+    assert found == QUERIES
+
+
+def test_stream_joins_chunks_split_mid_token(stub):
+    # The queries are split across deltas and every event across TCP writes, in the middle of tokens
+    content = "\n".join(json.dumps(query) for query in QUERIES)
+    events = b"".join(sse_event(piece) for piece in split_every(content, 7))
+    stub.script = [200, b": keep-alive\n\n", *split_every(events, 5), b"data: [DONE]\n\n"]
+
+    queries = list(client(stub.url).stream_queries({"model": "test", "messages": []}))
+
+    assert queries == QUERIES
+    assert stub.requests[0]["stream"] is True
+
+
+def test_stream_ends_at_done_without_waiting_for_the_connection(stub):
+    stub.script = [200, sse_event(json.dumps(QUERIES[0])), b"data: [DONE]\n\n", sse_event("ignored"), StubServer.HANG]
+
+    start = time.monotonic()
+    pieces = list(client(stub.url, timeout=(1, 5)).stream({"messages": []}))
+
+    assert pieces == [json.dumps(QUERIES[0])]
+    assert time.monotonic() - start < 2
+
+
+def test_stalled_stream_raises_after_the_read_timeout(stub):
+    stub.script = [200, sse_event("first"), StubServer.HANG]
+
+    pieces = []
+    start = time.monotonic()
+    with pytest.raises(requests.RequestException):
+        for piece in client(stub.url, timeout=(1, 0.3)).stream({"messages": []}):
+            pieces.append(piece)
+
+    assert pieces == ["first"]
+    assert time.monotonic() - start < 3
+    # A stream that breaks half way is not sent again
+    assert len(stub.requests) == 1
+
+
+def test_missing_response_is_retried_then_read_timeout(stub):
+    stub.script = [StubServer.HANG]
+
+    with pytest.raises(requests.ReadTimeout):
+        list(client(stub.url, timeout=(1, 0.3)).stream({"messages": []}))
+
+    assert len(stub.requests) == 2
+
+
+def test_connect_timeout():
+    # A listener that never accepts, once its backlog is full new connections hang in the handshake
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(0)
+    address = listener.getsockname()
+    waiting = []
+    try:
+        for _ in range(8):
+            connection = socket.create_connection(address, timeout=0.2)
+            waiting.append(connection)
+    except OSError:
+        pass
+    try:
+        start = time.monotonic()
+        with pytest.raises(requests.ConnectTimeout):
+            list(client(f"http://{address[0]}:{address[1]}/", timeout=(0.3, 5)).stream({"messages": []}))
+        assert time.monotonic() - start < 3
+    finally:
+        for connection in waiting:
+            connection.close()
+        listener.close()
+
+
+@pytest.mark.parametrize("body", [
+    b"<html><body>502 Bad Gateway</body></html>",
+    b'{"error": {"message": "Rate limit exceeded", "code": 429}}',
+    b'{"choices": []}',
+    b'["not", "a", "completion"]',
+])
+def test_malformed_completion_is_none(stub, body):
+    stub.script = [200, body]
+
+    assert client(stub.url).complete({"messages": []}) is None
+    assert client(stub.url).complete_many([{"messages": []}, {"messages": []}]) == [None, None]
+
+
+def test_stream_skips_events_that_are_not_completion_chunks(stub):
+    stub.script = [200, b'data: {"error": {"message": "overloaded"}}\n\n', b"data: [1, 2]\n\n", sse_event("ok"), b"data: [DONE]\n\n"]
+
+    assert list(client(stub.url).stream({"messages": []})) == ["ok"]
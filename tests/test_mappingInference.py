@@ -0,0 +1,25 @@
+import pandas as pd
+from ingest import prepare_chunk, read_csv_chunks
+from mappingInference import InferredMappy
+
+
+def test_iso_dates_with_zones_are_uploaded_in_utc(tmp_path):
+    csv_file = tmp_path / "events.csv"
+    pd.DataFrame({
+        "event": ["a", "b", "c"],
+        "utc": ["2009-03-08T00:27:31.807Z", "2009-03-08T01:00:00Z", "2009-03-08T02:00:00Z"],
+        "offset": ["2023-12-01T14:30:00+02:00", "2023-12-01T15:30:00+02:00", "2023-12-01T16:30:00-05:00"],
+        "local": ["2023-12-01 14:30", "2023-12-01 14:30:00.5", "2023-12-01T14:30:00"],
+    }).to_csv(csv_file, index=False)
+
+    mappy = InferredMappy("events", str(csv_file))
+    properties = mappy.manualMappings()["mappings"]["properties"]
+    for column in ("utc", "offset", "local"):
+        assert properties[column] == {"type": "date", "format": "strict_date_optional_time"}
+
+    # Two rows per chunk, milliseconds are written for every row of a chunk that has any
+    documents = [doc for df in read_csv_chunks(str(csv_file), 2) for _, doc in prepare_chunk(df, mappy)]
+
+    assert [doc["utc"] for doc in documents] == ["2009-03-08T00:27:31.807", "2009-03-08T01:00:00.000", "2009-03-08T02:00:00"]
+    assert [doc["offset"] for doc in documents] == ["2023-12-01T12:30:00", "2023-12-01T13:30:00", "2023-12-01T21:30:00"]
+    assert [doc["local"] for doc in documents] == ["2023-12-01T14:30:00.000", "2023-12-01T14:30:00.500", "2023-12-01T14:30:00"]
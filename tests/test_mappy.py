@@ -0,0 +1,33 @@
+import pandas as pd
+from mappy import ParseDate
+
+
+def parse(values, **kwargs):
+    df = pd.DataFrame({"when": values})
+    ParseDate("when", **kwargs).apply(df)
+    return df["when"].tolist()
+
+
+def test_naive_values_keep_milliseconds_only_when_there_are_some():
+    assert parse(["2023-12-01 14:30:00", None], format="%Y-%m-%d %H:%M:%S") == ["2023-12-01T14:30:00", None]
+    assert parse(["2023-12-01T14:30:00.123", "2023-12-01T14:30:00"], format="ISO8601") == [
+        "2023-12-01T14:30:00.123", "2023-12-01T14:30:00.000",
+    ]
+
+
+def test_zoned_values_are_converted_to_utc():
+    assert parse(["2009-03-08T00:27:31.807Z", "2009-03-08T02:27:31Z"], format="ISO8601") == [
+        "2009-03-08T00:27:31.807", "2009-03-08T02:27:31.000",
+    ]
+    assert parse(["2023-12-01T14:30:00+02:00", None], format="ISO8601") == ["2023-12-01T12:30:00", None]
+
+
+def test_mixed_offsets_and_unparseable_values():
+    values = ["2023-12-01T14:30:00+02:00", "2023-12-01T14:30:00-05:00", "2023-12-01T14:30:00", "soon"]
+    assert parse(values, format="ISO8601") == [
+        "2023-12-01T12:30:00", "2023-12-01T19:30:00", "2023-12-01T14:30:00", None,
+    ]
+
+
+def test_epoch_milliseconds():
+    assert parse([1236472051807, None], unit="ms") == ["2009-03-08T00:27:31.807", None]
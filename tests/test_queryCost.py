@@ -0,0 +1,59 @@
+import sqlite3
+import pytest
+from queryCost import CostBudget, estimate_sqlite_query, estimate_sqlite_rows
+
+
+@pytest.fixture(scope="module")
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE big (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany("INSERT INTO big VALUES (?, ?)", ((i, f"name {i % 100}") for i in range(1, 200001)))
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+    conn.execute("CREATE TABLE u (id INTEGER PRIMARY KEY)")
+    conn.executemany("INSERT INTO t VALUES (?)", ((i,) for i in range(1, 20001)))
+    conn.executemany("INSERT INTO u VALUES (?)", ((i,) for i in range(1, 20001)))
+    conn.execute("CREATE TABLE small (a INTEGER)")
+    conn.executemany("INSERT INTO small VALUES (?)", ((i,) for i in range(50)))
+    yield conn
+    conn.close()
+
+
+def estimate(conn, query, max_rows=10000):
+    return estimate_sqlite_query(conn, query, CostBudget(max_rows=max_rows))
+
+
+def test_own_limit_caps_a_streaming_query(conn):
+    result = estimate(conn, "SELECT * FROM big LIMIT 10")
+    assert not result.over_budget
+    assert result.rows == 10
+    assert result.query == "SELECT * FROM big LIMIT 10"
+
+    assert estimate(conn, "SELECT * FROM big LIMIT 100 OFFSET 50;").rows == 150
+    assert estimate(conn, "SELECT * FROM big LIMIT 20000").over_budget
+
+
+def test_limit_is_added_to_a_streaming_query_without_one(conn):
+    result = estimate(conn, "SELECT * FROM big")
+    assert not result.over_budget
+    assert result.query == "SELECT * FROM big\nLIMIT 10000"
+    assert result.rewrites == ["LIMIT 10,000 added"]
+
+
+def test_limit_does_not_cap_sorts_or_aggregates(conn):
+    assert estimate(conn, "SELECT * FROM big ORDER BY name LIMIT 10").over_budget
+    assert estimate(conn, "SELECT name, count(*) FROM big GROUP BY name LIMIT 10").over_budget
+
+
+def test_primary_key_lookups(conn):
+    assert estimate(conn, "SELECT * FROM big WHERE id = 5").rows == 1
+    # A range on the primary key is a quarter of the table, not one row
+    assert estimate_sqlite_rows(conn, "SELECT * FROM big WHERE id > 5") == (50000, False)
+    # u.id > t.id visits about 2 * 10^8 rows, it streams so it only runs with a LIMIT
+    assert estimate_sqlite_rows(conn, "SELECT * FROM t JOIN u ON u.id > t.id") == (20000 * 5000, False)
+    assert estimate(conn, "SELECT * FROM t JOIN u ON u.id > t.id").rewrites == ["LIMIT 10,000 added"]
+    assert estimate(conn, "SELECT count(*) FROM t JOIN u ON u.id > t.id").over_budget
+
+
+def test_rows_that_are_not_tables(conn):
+    assert estimate(conn, "SELECT 1").rows == 1
+    assert estimate(conn, "SELECT (SELECT count(*) FROM small)").rows == 51
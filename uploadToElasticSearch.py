@@ -1,7 +1,13 @@
 import pandas as pd
 from elasticsearch import Elasticsearch, helpers
 from mappingFactory import MappingFactory
+from resultCache import bump_generation
+from ingest import (
+    read_csv_chunks, prepare_chunk, document_ids, parse_blocks_in_pool, Checkpoint, ProgressReporter,
+    load_manifest, save_manifest, diff_chunk,
+)
 import numpy as np
+import os
 from dotenv import dotenv_values
 
 from dateutil import parser
@@ -13,10 +19,17 @@ config = dotenv_values(".env")
 csv_file_path = config["csv_file_path"]
 
 index_name = config["index_name"]
-
+upload_mode = config.get("upload_mode", "bulk")
+chunk_size = int(config.get("chunk_size", 10000))  # CSV rows read per chunk
+bulk_chunk_size = int(config.get("bulk_chunk_size", 500))  # documents per bulk request
+max_chunk_bytes = int(config.get("max_chunk_bytes", 100 * 1024 * 1024))  # bytes per bulk request
+thread_count = int(config.get("thread_count", 4))  # concurrent bulk requests
+parse_processes = int(config.get("parse_processes", os.cpu_count() or 1))  # CSV parsing workers
+bulk_load = config.get("bulk_load", "false").lower() == "true"
+force_merge_segments = config.get("force_merge_segments")
 
 mappingFactory = MappingFactory()
-mappy = mappingFactory.getMappy(index_name)
+mappy = mappingFactory.getMappy(index_name, csv_file_path)
 
 # Connect to Elasticsearch
 es = Elasticsearch(
@@ -26,16 +39,20 @@ es = Elasticsearch(
 )
 
 
+def create_index(index_name):
+    # Create index with mapping
+    if not es.indices.exists(index=index_name):
+        es.indices.create(index=index_name,body=mappy.manualMappings())
+
+
 def upload_csv_to_elasticsearch(csv_file, index_name):
     # Read CSV
     df = pd.read_csv(csv_file)
     print(df)
     
-    # Create index with mapping
-    
-    if not es.indices.exists(index=index_name):
-        es.indices.create(index=index_name,body=mappy.manualMappings())
+    create_index(index_name)
     
+    ids = document_ids(df, mappy.idColumn)
     # Convert DataFrame to list of dicts
     # Replace NaN with None to avoid issues
     df = df.replace({np.nan: None})
@@ -47,9 +64,10 @@ def upload_csv_to_elasticsearch(csv_file, index_name):
     actions = [
         {
             "_index": index_name,
+            "_id": doc_id,
             "_source": doc
         }
-        for doc in documents
+        for doc_id, doc in zip(ids, documents)
     ]
     
     # Bulk index the data
@@ -63,7 +81,212 @@ def upload_csv_to_elasticsearch(csv_file, index_name):
     print(f"Uploaded {len(documents)} documents to index {index_name}")
 
 
+def checkpoint_for(csv_file, index_name):
+    path = os.path.join(os.path.dirname(csv_file), index_name + "_checkpoint.json")
+    return Checkpoint(path, csv_file, chunk_size, upload_mode)
+
+
+def generate_actions(csv_file, index_name, checkpoint):
+    """Yield bulk actions chunk by chunk so only one chunk is held in memory"""
+    start = checkpoint.resume_from()
+    for chunk_no, df in enumerate(read_csv_chunks(csv_file, chunk_size)):
+        if chunk_no < start:
+            continue
+        documents = prepare_chunk(df, mappy)
+        checkpoint.add_chunk(chunk_no, len(documents))
+        for doc_id, doc in documents:
+            yield {
+                "_index": index_name,
+                "_id": doc_id,
+                "_source": doc
+            }
+
+
+def upload_csv_streaming(csv_file, index_name):
+    """Stream the CSV into Elasticsearch with bounded memory, reporting throughput"""
+    create_index(index_name)
+
+    checkpoint = checkpoint_for(csv_file, index_name)
+    progress = ProgressReporter(index_name)
+    for ok, item in helpers.streaming_bulk(
+        es,
+        generate_actions(csv_file, index_name, checkpoint),
+        chunk_size=bulk_chunk_size,
+        max_chunk_bytes=max_chunk_bytes,
+        raise_on_error=False,
+    ):
+        if not ok:
+            print(f"Error details: {item}")
+        progress.update(ok)
+        checkpoint.acknowledge(ok)
+    progress.finish()
+    checkpoint.complete()
+
+
+def generate_parallel_actions(csv_file, index_name, checkpoint):
+    """Yield bulk actions from documents parsed and transformed in the process pool"""
+    start = checkpoint.resume_from()
+    for block_no, documents in parse_blocks_in_pool(
+        csv_file, index_name, chunk_size, parse_processes, skip=start
+    ):
+        checkpoint.add_chunk(block_no, len(documents))
+        for doc_id, doc in documents:
+            yield {
+                "_index": index_name,
+                "_id": doc_id,
+                "_source": doc
+            }
+
+
+def upload_csv_parallel(csv_file, index_name):
+    """Parse the CSV in worker processes and index it with several bulk threads"""
+    create_index(index_name)
+
+    print(
+        f"Parallel upload: {parse_processes} parse processes, {thread_count} bulk threads, "
+        f"{bulk_chunk_size} docs / {max_chunk_bytes} bytes per request"
+    )
+    checkpoint = checkpoint_for(csv_file, index_name)
+    progress = ProgressReporter(index_name)
+    for ok, item in helpers.parallel_bulk(
+        es,
+        generate_parallel_actions(csv_file, index_name, checkpoint),
+        thread_count=thread_count,
+        chunk_size=bulk_chunk_size,
+        max_chunk_bytes=max_chunk_bytes,
+        raise_on_error=False,
+    ):
+        if not ok:
+            print(f"Error details: {item}")
+        progress.update(ok)
+        # parallel_bulk yields results in the order the actions were sent
+        checkpoint.acknowledge(ok)
+    progress.finish()
+    checkpoint.complete()
+
+
+def apply_bulk_load_settings(index_name, profile):
+    """Switch the index to the bulk-load settings and return the settings they replaced"""
+    current = es.indices.get_settings(index=index_name, flat_settings=True, include_defaults=True)[index_name]
+    original = {}
+    for key in profile["settings"]:
+        full_key = key if key.startswith("index.") else "index." + key
+        original[key] = current["settings"].get(full_key, current.get("defaults", {}).get(full_key))
+
+    es.indices.put_settings(index=index_name, settings=profile["settings"])
+    print(f"Applied bulk-load settings {profile['settings']} to index {index_name}")
+    return original
+
+
+def restore_index_settings(index_name, original, profile):
+    """Put back the original settings, refresh once and optionally force-merge"""
+    es.indices.put_settings(index=index_name, settings=original)
+    es.indices.refresh(index=index_name)
+    print(f"Restored settings {original} on index {index_name}")
+
+    segments = force_merge_segments or profile.get("force_merge_segments")
+    if segments:
+        print(f"Force-merging index {index_name} to {segments} segment(s)")
+        es.indices.forcemerge(index=index_name, max_num_segments=int(segments))
+
+
+def upload(csv_file, index_name):
+    if upload_mode == "delta":
+        upload_csv_delta(csv_file, index_name)
+    elif upload_mode == "parallel":
+        upload_csv_parallel(csv_file, index_name)
+    elif upload_mode == "streaming":
+        upload_csv_streaming(csv_file, index_name)
+    else:
+        upload_csv_to_elasticsearch(csv_file, index_name)
+
+
+def upload_with_bulk_load_profile(csv_file, index_name):
+    """Run the upload with refreshes and replicas turned off, restoring them even if it fails"""
+    create_index(index_name)
+    profile = mappy.bulkLoadProfile()
+    original = apply_bulk_load_settings(index_name, profile)
+    try:
+        upload(csv_file, index_name)
+    finally:
+        restore_index_settings(index_name, original, profile)
+
+
+def generate_delta_actions(csv_file, index_name, previous, manifests, counts):
+    """
+    Yield index actions for new or changed rows, then delete actions for rows that disappeared.
+
+    The manifest of every chunk is appended to manifests so the caller can save it afterwards.
+    """
+    for df in read_csv_chunks(csv_file, chunk_size):
+        changed, manifest = diff_chunk(df, mappy, previous)
+        manifests.append(manifest)
+        counts["unchanged"] += int((~changed).sum())
+        if not changed.any():
+            continue
+        for doc_id, doc in prepare_chunk(df[changed].copy(), mappy):
+            counts["upserted"] += 1
+            yield {
+                "_index": index_name,
+                "_id": doc_id,
+                "_source": doc
+            }
+
+    seen = pd.Index([]).append([manifest.index for manifest in manifests]) if manifests else pd.Index([])
+    for doc_id in previous.index.difference(seen):
+        counts["deleted"] += 1
+        yield {
+            "_op_type": "delete",
+            "_index": index_name,
+            "_id": doc_id
+        }
+
+
+def upload_csv_delta(csv_file, index_name):
+    """Only send rows that are new or changed since the last upload, and delete removed rows"""
+    create_index(index_name)
+
+    manifest_path = os.path.join(os.path.dirname(csv_file), index_name + "_manifest.parquet")
+    previous = load_manifest(manifest_path)
+    manifests = []
+    counts = {"upserted": 0, "deleted": 0, "unchanged": 0}
+    failed = 0
+
+    progress = ProgressReporter(index_name)
+    for ok, item in helpers.streaming_bulk(
+        es,
+        generate_delta_actions(csv_file, index_name, previous, manifests, counts),
+        chunk_size=bulk_chunk_size,
+        max_chunk_bytes=max_chunk_bytes,
+        raise_on_error=False,
+    ):
+        # Deleting a document that is already gone is not a failure
+        if not ok and item.get("delete", {}).get("status") == 404:
+            ok = True
+        if not ok:
+            failed += 1
+            print(f"Error details: {item}")
+        progress.update(ok)
+    progress.finish()
+    print(
+        f"Delta upload: {counts['upserted']} new or changed, {counts['deleted']} deleted, "
+        f"{counts['unchanged']} unchanged"
+    )
+
+    # Keep the old manifest when something failed so the next run sends those rows again
+    if failed:
+        print(f"{failed} action(s) failed, manifest {manifest_path} was not updated")
+    else:
+        manifest = pd.concat(manifests) if manifests else previous.iloc[:0]
+        save_manifest(manifest_path, manifest[~manifest.index.duplicated()])
 
 
 # Call the function
-upload_csv_to_elasticsearch(csv_file_path, index_name)
\ No newline at end of file
+# Guarded so the parse worker processes can import this module without uploading again
+if __name__ == "__main__":
+    if bulk_load:
+        upload_with_bulk_load_profile(csv_file_path, index_name)
+    else:
+        upload(csv_file_path, index_name)
+    # Tell the dashboard its cached widget results are stale
+    bump_generation(os.path.dirname(csv_file_path), "elasticsearch", index_name)
\ No newline at end of file
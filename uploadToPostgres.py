@@ -3,6 +3,8 @@ import psycopg2
 from psycopg2 import sql
 from sqlalchemy import create_engine
 from dotenv import dotenv_values
+from sqlLoad import copy_csv_to_postgres
+from resultCache import bump_generation
 
 
 # Load environment variables
@@ -13,6 +15,9 @@ db_user = config["database_user"]
 db_password = config["database_password"]
 db_host = config["database_host"]
 db_port = config["database_port"]
+# "copy" streams the csv with COPY FROM STDIN, "to_sql" uses pandas row inserts
+postgres_loader = config.get("postgres_loader", "copy")
+copy_chunk_size = int(config.get("copy_chunk_size", 100000))
 
 csv_file_paths = ["customers.csv", "orders.csv", "products.csv"]
 
@@ -61,39 +66,80 @@ def dfMutation(df):
         df['Order_Date'] = pd.to_datetime(df['Order_Date'], format='%m/%d/%Y', errors='coerce').dt.date
                     
 
-try:
-    engine = create_engine(
-        f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-    )
-    print("Connection to PostgreSQL established successfully.")
-except Exception as e:
-    print(f"Error connecting to PostgreSQL: {e}")
-    exit()
-    
-try:
-    with engine.connect() as connection:
-        with connection.begin():
-            # Process and save CSV data into PostgreSQL
-            for csv_file_path in csv_file_paths:
-                name = csv_file_path.split(".")[0]
-                csv_file_path = path + "/" + csv_file_path
-                try:
-                    # Read CSV file into a DataFrame
-                    df = pd.read_csv(csv_file_path)
-                    df.columns = df.columns.str.replace(" ", "_")  # Replace spaces in column names
-                    
-                    # Format the 'Order_Date' column if it exists
-                    dfMutation(df)
-                    
-                    # Save DataFrame to PostgreSQL table
-                    df.to_sql(name, connection, if_exists='replace', index=False)  # Options: 'replace', 'append', 'fail'
-                    print(f"Data saved to table '{name}' successfully.")
-
-                except Exception as e:
-                    print(f"Error processing file '{csv_file_path}': {e}")           
-except Exception as e:
-    print(f"Database error: {e}")
-
-# Close the connection (optional since SQLAlchemy handles it automatically)
-engine.dispose()
-print("Connection closed.")
\ No newline at end of file
+def copy_csv_files():
+    """Load every csv with COPY on a single psycopg2 connection, one transaction per file"""
+    try:
+        conn = psycopg2.connect(
+            host=db_host,
+            port=db_port,
+            user=db_user,
+            password=db_password,
+            dbname=db_name
+        )
+        print("Connection to PostgreSQL established successfully.")
+    except psycopg2.Error as e:
+        print(f"Error connecting to PostgreSQL: {e}")
+        exit()
+
+    try:
+        for csv_file_path in csv_file_paths:
+            name = csv_file_path.split(".")[0]
+            csv_file_path = path + "/" + csv_file_path
+            try:
+                rows = copy_csv_to_postgres(conn, csv_file_path, name, chunk_size=copy_chunk_size, mutate=dfMutation)
+                conn.commit()
+                print(f"Data saved to table '{name}' successfully ({rows} rows).")
+            except Exception as e:
+                conn.rollback()
+                print(f"Error processing file '{csv_file_path}': {e}")
+    finally:
+        conn.close()
+        print("Connection closed.")
+
+
+def to_sql_csv_files():
+    """Load every csv with pandas to_sql (row inserts)"""
+    try:
+        engine = create_engine(
+            f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+        )
+        print("Connection to PostgreSQL established successfully.")
+    except Exception as e:
+        print(f"Error connecting to PostgreSQL: {e}")
+        exit()
+        
+    try:
+        with engine.connect() as connection:
+            with connection.begin():
+                # Process and save CSV data into PostgreSQL
+                for csv_file_path in csv_file_paths:
+                    name = csv_file_path.split(".")[0]
+                    csv_file_path = path + "/" + csv_file_path
+                    try:
+                        # Read CSV file into a DataFrame
+                        df = pd.read_csv(csv_file_path)
+                        df.columns = df.columns.str.replace(" ", "_")  # Replace spaces in column names
+                        
+                        # Format the 'Order_Date' column if it exists
+                        dfMutation(df)
+                        
+                        # Save DataFrame to PostgreSQL table
+                        df.to_sql(name, connection, if_exists='replace', index=False)  # Options: 'replace', 'append', 'fail'
+                        print(f"Data saved to table '{name}' successfully.")
+
+                    except Exception as e:
+                        print(f"Error processing file '{csv_file_path}': {e}")           
+    except Exception as e:
+        print(f"Database error: {e}")
+
+    # Close the connection (optional since SQLAlchemy handles it automatically)
+    engine.dispose()
+    print("Connection closed.")
+
+
+if postgres_loader == "copy":
+    copy_csv_files()
+else:
+    to_sql_csv_files()
+# Tell the dashboards their cached widget results are stale
+bump_generation(path, "postgres", db_name)
@@ -1,31 +1,71 @@
-import pandas as pd
+import glob
+import os
 import sqlite3
+import time
+import pandas as pd
 from dotenv import dotenv_values
+from sqlLoad import load_csv_to_sqlite
+from resultCache import bump_generation
 
 config = dotenv_values(".env")
-# csv_file_paths = config["csv_file_paths"]
 path = config["path"]
 db_file = config["database_name_sqlite"]
 
-csv_file_paths = ["customers.csv","orders.csv","products.csv"]
+# Comma separated csv files inside path, defaults to every csv in it
+if config.get("csv_file_paths"):
+    csv_file_paths = [name.strip() for name in config["csv_file_paths"].split(",") if name.strip()]
+else:
+    csv_file_paths = sorted(os.path.basename(f) for f in glob.glob(os.path.join(path, "*.csv")))
+
+chunk_size = int(config.get("sqlite_chunk_size", 100000))
+# Durability is relaxed during the load only, a crash mid-load just means loading again
+load_synchronous = config.get("sqlite_synchronous", "OFF")
+# Comma separated table.column pairs to index after loading, e.g. "orders.Customer_ID,orders.Order_Date"
+index_columns = [name.strip() for name in config.get("sqlite_indexes", "").split(",") if name.strip()]
+run_analyze = config.get("sqlite_analyze", "true").lower() == "true"
+
+
+def dfMutation(df):
+    if "Order_Date" in df:
+        df['Order_Date'] = pd.to_datetime(df['Order_Date'], format='%m/%d/%Y', errors='coerce').dt.date
+
+
+def build_indexes(conn):
+    for index_column in index_columns:
+        table, column = index_column.split(".", 1)
+        index_name = f"idx_{table}_{column}".replace(" ", "_")
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ("{column}")')
+        print(f"Index {index_name} created.")
+
+
+# One connection for the whole load, transactions are managed explicitly
+conn = sqlite3.connect(db_file, isolation_level=None)
+try:
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={load_synchronous}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")  # 256 MiB page cache
+
+    for csv_file_path in csv_file_paths:
+        name = csv_file_path.split(".")[0]
+        csv_file_path = path + "/" + csv_file_path
+        try:
+            start = time.perf_counter()
+            rows = load_csv_to_sqlite(conn, csv_file_path, name, chunk_size=chunk_size, mutate=dfMutation)
+            elapsed = time.perf_counter() - start
+            print(f"Data saved to table '{name}' successfully ({rows} rows, {rows / max(elapsed, 1e-9):.0f} rows/sec).")
 
+        except Exception as e:
+            print(f"Error processing file '{csv_file_path}': {e}")
 
-for csv_file_path in csv_file_paths:
-    name = csv_file_path.split(".")[0]
-    csv_file_path = path + "/" + csv_file_path
-    try:
-        df = pd.read_csv(csv_file_path)
-        df.columns = df.columns.str.replace(" ", "_")
-        if "Order_Date" in df:
-            df['Order_Date'] = pd.to_datetime(df['Order_Date'], format='%m/%d/%Y', errors='coerce').dt.date
-        
-        conn = sqlite3.connect(db_file)
-        df.to_sql(name, conn, if_exists='replace', index=False) #if_exists can be 'replace', 'append', 'fail'
-        print("Data saved to database successfully.")
+    build_indexes(conn)
+    if run_analyze:
+        conn.execute("ANALYZE")
+        print("Statistics updated with ANALYZE.")
+    conn.execute("PRAGMA synchronous=NORMAL")
 
-    except Exception as e:
-        print(f"Error: {e}")
+finally:
+    conn.close()
 
-    finally:
-        if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+# Tell the dashboards their cached widget results are stale
+bump_generation(path, "sqlite", db_file)